@@ -0,0 +1,152 @@
+import time
+import heapq
+import threading
+
+class Job(object):
+    def __init__(self,name,fn,interval,minInterval=None,maxInterval=None,adaptive=True,targetYield=0.5,args=(),kwargs=None):
+        '''a periodic job whose interval follows the yield of its runs
+        fn returns a stats dict {'received','new','errors', optional 'latency'} or None on failure
+        params---
+            name: str: shown in cadence()
+            fn: callable
+            interval: float: initial seconds between runs
+            minInterval/maxInterval: float: bounds the interval is kept within: default interval (fixed)
+            adaptive: bool: False runs every interval regardless of stats e.g. health checks
+            targetYield: float: fraction of new items per run the interval is tuned towards
+        '''
+        self.name=name
+        self.fn=fn
+        self.args=args
+        self.kwargs=kwargs or {}
+        self.interval=interval
+        self.minInterval=interval if minInterval is None else minInterval
+        self.maxInterval=interval if maxInterval is None else maxInterval
+        self.adaptive=adaptive
+        self.targetYield=targetYield
+        self.nextRun=time.monotonic()
+        self.runs=0
+        self.failures=0
+        self.lastYield=None
+        self.lastLatency=None
+        self.latencyAvg=None #ewma of run latency
+        self.lastStats=None
+
+    def adapt(self,stats,latency,failed):
+        '''next interval from the last run
+        - failure/errors: back off x2 so a struggling upstream is not hammered
+        - yield above target (mostly new items, likely missing data): shorten, below target: lengthen, clamped to x0.5..x2 per run
+        - latency well above its average: upstream is slowing down, lengthen by at least x1.5
+        - never poll more often than twice the time a run takes
+        returns---
+        float: new interval
+        '''
+        if(not self.adaptive):
+            return self.interval
+        if(failed or stats.get('errors') and not stats.get('new')):
+            factor=2.0
+        else:
+            received=stats.get('received',0)
+            self.lastYield=stats.get('new',0)/received if received else 0.0
+            factor=min(2.0,max(0.5,self.targetYield/max(self.lastYield,0.01)))
+        if(self.latencyAvg is not None and latency>2*self.latencyAvg):
+            factor=max(factor,1.5)
+        self.latencyAvg=latency if self.latencyAvg is None else 0.8*self.latencyAvg+0.2*latency
+        self.interval=min(self.maxInterval,max(self.minInterval,self.interval*factor,2*latency))
+        return self.interval
+
+class AdaptiveScheduler(object):
+    def __init__(self,logging=None):
+        '''single event loop running every job (populate, merge, backfill, ...) at its own adaptive cadence
+        jobs run one at a time in due order, the loop sleeps until the next one is due
+        params---
+            logging: enable logs
+        '''
+        self.jobs={}
+        self.__queue=[] #heap of (nextRun, seq, name)
+        self.__seq=0
+        self.__stop=threading.Event()
+        self.__lock=threading.Lock()
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def __push(self,job):
+        self.__seq+=1
+        heapq.heappush(self.__queue,(job.nextRun,self.__seq,job.name))
+
+    def add(self,name,fn,interval,minInterval=None,maxInterval=None,adaptive=True,targetYield=0.5,args=(),kwargs=None,delay=0):
+        '''register a job, first run after delay seconds (see Job for params)
+        returns---
+        Job
+        '''
+        job=Job(name,fn,interval,minInterval=minInterval,maxInterval=maxInterval,adaptive=adaptive,targetYield=targetYield,args=args,kwargs=kwargs)
+        job.nextRun=time.monotonic()+delay
+        with self.__lock:
+            self.jobs[name]=job
+            self.__push(job)
+        return job
+
+    def cadence(self):
+        '''current schedule of every job
+        returns---
+        dict: name -> {'interval','dueIn','runs','failures','lastYield','lastLatency'}
+        '''
+        now=time.monotonic()
+        with self.__lock:
+            return {name:{'interval':round(job.interval,2),'dueIn':round(max(0,job.nextRun-now),2),'runs':job.runs,'failures':job.failures,
+                          'lastYield':job.lastYield,'lastLatency':job.lastLatency} for name,job in self.jobs.items()}
+
+    def runJob(self,job):
+        '''run a job once and reschedule it from its stats'''
+        start=time.monotonic()
+        failed=False
+        try:
+            stats=job.fn(*job.args,**job.kwargs)
+        except Exception as err:
+            print('Job {} failed: {}'.format(job.name,err))
+            stats,failed=None,True
+        latency=time.monotonic()-start
+        if(not isinstance(stats,dict)):
+            failed=failed or (stats is None and job.adaptive) #fixed jobs need not return stats
+            stats={}
+        latency=stats.get('latency',latency)
+        with self.__lock:
+            job.runs+=1
+            job.failures+=failed
+            job.lastLatency=round(latency,3)
+            job.lastStats=stats
+            previous=job.interval
+            job.adapt(stats,latency,failed)
+            job.nextRun=time.monotonic()+job.interval
+            self.__push(job)
+        if(self.logger and job.interval!=previous):
+            self.logger.info('{} interval {:.1f}s -> {:.1f}s (yield {}, latency {:.2f}s)'.format(job.name,previous,job.interval,job.lastYield,latency))
+
+    def runPending(self):
+        '''run every job that is due
+        returns---
+        float: seconds until the next job is due
+        '''
+        while True:
+            with self.__lock:
+                if(not self.__queue):
+                    return None
+                nextRun,_,name=self.__queue[0]
+                if(nextRun>time.monotonic()):
+                    return nextRun-time.monotonic()
+                heapq.heappop(self.__queue)
+                job=self.jobs.get(name)
+            if(job is not None and job.nextRun==nextRun): #removed or rescheduled jobs leave stale heap entries
+                self.runJob(job)
+
+    def run(self):
+        '''event loop: runs until stop() is called'''
+        while not self.__stop.is_set():
+            wait=self.runPending()
+            self.__stop.wait(1 if wait is None else wait)
+
+    def stop(self):
+        self.__stop.set()
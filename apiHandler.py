@@ -2,30 +2,80 @@
 # standard libraries 
 import os 
 import csv
+import codecs
+import time
 import json
 from dotenv import load_dotenv, find_dotenv
 from pathlib import Path 
 import logging
 import numpy as np 
 import pandas as pd 
+import threading
 import requests
-from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlparse
 import urls
+from httpCache import HttpCache
+import metrics
+import quotaGovernor
+from quotaGovernor import RateLimitError
 
 #retry library
-from tenacity import retry,stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import retry,stop_after_attempt, wait_exponential, retry_if_exception_type, wait_none
 #load environment to access API key 
 load_dotenv(".env")
 
+class ServiceUnavailableError(requests.exceptions.HTTPError):
+    '''503 without Retry-After: retried with exponential backoff as the governor has nothing to wait for'''
+
+def raiseForRateLimit(call,response):
+    '''429 or 503 with Retry-After -> RateLimitError (the governor blocks the host until it may be called again)
+    503 without -> ServiceUnavailableError'''
+    retryAfter = quotaGovernor.parseRetryAfter(response.headers.get('Retry-After'))
+    if(response.status_code==429 or (response.status_code==503 and retryAfter is not None)):
+        response.close()
+        raise RateLimitError(urlparse(call).netloc,response.status_code,retryAfter)
+    if(response.status_code==503):
+        response.close()
+        raise ServiceUnavailableError('503 Service Unavailable for url: {}'.format(call),response=response)
+
+def waitRateLimited(retryState):
+    '''tenacity wait: rate limited calls retry at once as the governor already sleeps until the host may be called
+    other failures (timeouts, connection errors, 503 without Retry-After) back off exponentially (4-10s)'''
+    if(isinstance(retryState.outcome.exception(),RateLimitError)):
+        return wait_none()(retryState)
+    return wait_exponential(multiplier=1,min=4,max=10)(retryState)
+
+def rateLimitGiveUp(retryState):
+    '''called once retries are exhausted: keep sendRequest's None on failure contract'''
+    print('Giving up after {} attempts: {}'.format(retryState.attempt_number,retryState.outcome.exception()))
+    return None
+
 class ApiHandler(object):
-    def __init__(self,api_key=None,language=None,request_exec=None,logging=None):
+    def __init__(self,api_key=None,language=None,request_exec=None,logging=None,poolSize=10,timeout=(3.05,30),cacheDir='.http_cache',cacheMaxAge=3600,baseUrl=None,governor=None):
         '''params---
             api_key = steam web api key ->required to be provided or exist in environment variable 
             language = localization to call in steamapi 
-            request_exec: what to use to send requests: default python requests
+            request_exec: what to use to send requests: callable(url, headers=, timeout=) returning a requests style response
+                          default: pooled keep-alive requests.Session per upstream host
             logging: enable logs
+            poolSize: int: max connections kept alive per host
+            timeout: (connect, read) seconds or single float for both
+            cacheDir: str: directory of the conditional request cache used by sendRequest for heroes/items urls (or cache=True)
+            cacheMaxAge: float: seconds a cached response is served without revalidating
+            baseUrl: str: send every Steam/OpenDota/GitHub call to this scheme://host[:port] instead, keeping the path
+                     e.g. a local benchmarks.replayServer: default DOTA2_API_BASE_URL env var, unset = real apis
+            governor: quotaGovernor.QuotaGovernor: per host rate limits shared with other processes: default the process wide one, False disables
         ''' 
-        request_exec=requests.get
+        self.request_exec=request_exec
+        self.poolSize=poolSize
+        self.timeout=timeout
+        self.__sessions={}
+        self.__sessionLock=threading.Lock()
+        self.httpCache=HttpCache(cacheDir,maxAge=cacheMaxAge)
+        self.__cachedUrls=set() #near static urls built by fetchHeroes/fetchHeroesDetailed/fetchItems: sendRequest caches them by default
+        self.baseUrl=baseUrl or os.getenv('DOTA2_API_BASE_URL')
+        self.governor=quotaGovernor.getGovernor() if governor is None else (governor or None)
         if(api_key):
             self.api_key=api_key
         else:
@@ -43,24 +93,85 @@ class ApiHandler(object):
         else:
             self.logger=None
     
+    def getSession(self,host):
+        '''return the keep-alive session for an upstream host, creating it on first use
+        params---
+        host: str: network location e.g. api.opendota.com
+        returns---
+        requests.Session
+        '''
+        with self.__sessionLock:
+            if(host not in self.__sessions):
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,pool_maxsize=self.poolSize)
+                session.mount('https://',adapter)
+                session.mount('http://',adapter)
+                session.headers.update({'Accept-Encoding':'gzip, deflate','Connection':'keep-alive'})
+                self.__sessions[host]=session
+                if(self.logger):
+                    self.logger.info('Session created for host: {}'.format(host))
+            return self.__sessions[host]
+
+    def __send(self,call,header=None,stream=False):
+        '''send get request through injected transport or pooled session'''
+        kwargs={'headers':header,'timeout':self.timeout}
+        if(stream):
+            kwargs['stream']=True
+        host=urlparse(call).netloc
+        if(self.governor):
+            self.governor.acquire(host) #waits for a token / Retry-After block shared by every process
+        start=time.perf_counter()
+        status='error'
+        try:
+            if(self.request_exec):
+                response=self.request_exec(call,**kwargs)
+            else:
+                response=self.getSession(host).get(call,**kwargs)
+            status=response.status_code
+            if(self.governor):
+                self.governor.observe(host,response)
+            if(not stream and metrics.enabled()): #streamed bodies are counted as they are read
+                metrics.RESPONSE_BYTES.inc(len(response.content),host=host)
+            return response
+        finally:
+            metrics.REQUEST_SECONDS.observe(time.perf_counter()-start,host=host,status=status)
+
+    def remainingBudget(self,host=None):
+        '''rate limit budget left per upstream host (see quotaGovernor.QuotaGovernor.remaining)'''
+        return self.governor.remaining(host) if self.governor else {}
+
+    def close(self):
+        '''close all pooled sessions'''
+        with self.__sessionLock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions={}
+
     @retry(
-        stop=stop_after_attempt(3), #retry limit
-        wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        stop=stop_after_attempt(5), #retry limit
+        wait=waitRateLimited, #delay before retries
+        retry = retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.Timeout, RateLimitError, ServiceUnavailableError)),
+        before_sleep=metrics.countRetry, #count retries per method
+        retry_error_callback=rateLimitGiveUp
     )
-    def sendRequest(self,call,header=None):
+    def sendRequest(self,call,header=None,cache=None):
         '''
         Return json response from get request
         Splitting various common errors to allow handling separately (e.g. adding wait time to resend to timeout etc)
         params---
         call: str
         :header: (dict) headers to be added to call
+        :cache: (bool) serve from the local http cache, revalidating with If-None-Match/If-Modified-Since: default True for urls of near static endpoints (fetchHeroes, fetchHeroesDetailed, fetchItems)
         returns---
-        json data
+        json data or None on failure
+        429/503 responses are retried once the quota governor lets the host be called again, connection errors/timeouts/503 without Retry-After back off exponentially
         '''
 
         try:
-            response  = requests.get(call,headers=header)            
+            if(cache or (cache is None and call in self.__cachedUrls)):
+                return self.__sendCached(call,header)
+            response  = self.__send(call,header)
+            raiseForRateLimit(call,response)
             response.raise_for_status()
             if(self.logger):
                 self.logger.info('Request sent:{} Response code: {} Additional headers: {} '.format(call,response.status_code,header))
@@ -69,6 +180,8 @@ class ApiHandler(object):
                 return response.json()
             else:
                 return response.text        
+        except (RateLimitError, ServiceUnavailableError, requests.exceptions.ConnectionError, requests.exceptions.Timeout): #retried by tenacity, None once retries are exhausted
+            raise
         except requests.exceptions.HTTPError as http_err:
             print('HTTP error: {}'.format(http_err))
         
@@ -87,6 +200,86 @@ class ApiHandler(object):
         except requests.exceptions.APIAuthenticationError as auth_err:
             print('API Auth error:{}'.format(auth_err))
 
+    @retry(
+        stop=stop_after_attempt(5), #retry limit
+        wait=waitRateLimited, #delay before retries
+        retry = retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.Timeout, RateLimitError, ServiceUnavailableError)),
+        before_sleep=metrics.countRetry, #count retries per method
+        retry_error_callback=rateLimitGiveUp
+    )
+    def openStream(self,call,header=None):
+        '''send a streamed get request, retried like sendRequest until the response headers arrive
+        returns---
+        response with an unread body or None on failure
+        '''
+        response = self.__send(call,header,stream=True)
+        raiseForRateLimit(call,response)
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        if(self.logger):
+            self.logger.info('Streaming request sent:{} Response code: {}'.format(call,response.status_code))
+        return response
+
+    def streamRequest(self,call,header=None,chunkSize=65536):
+        '''
+        Yield the response body of a get request as decoded text chunks instead of loading it all at once
+        pair with parseData.iterMatchesSteam to parse matches as they arrive
+        connection errors/timeouts before the first byte are retried (see openStream), once the body streams a failure ends the generator
+        params---
+        call: str
+        :header: (dict) headers to be added to call
+        chunkSize: int: bytes read per chunk (after gzip decompression)
+        returns---
+        generator of str
+        '''
+        try:
+            response = self.openStream(call,header)
+            if(response is None):
+                return
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+            try:
+                host = urlparse(call).netloc
+                for chunk in response.iter_content(chunk_size=chunkSize):
+                    metrics.RESPONSE_BYTES.inc(len(chunk),host=host)
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b'',final=True)
+            finally:
+                response.close()
+        except requests.exceptions.HTTPError as http_err:
+            print('HTTP error: {}'.format(http_err))
+        except requests.exceptions.RequestException as req_err:
+            print('Request error: {}'.format(req_err))
+
+    def __sendCached(self,call,header=None):
+        '''conditional get: memory copy if fresh, 304 served from disk copy, 200 stored with its validators'''
+        parsed = self.httpCache.fresh(call)
+        if(parsed is not None):
+            return parsed
+        entry = self.httpCache.lookup(call)
+        if(entry and time.time()-entry.get('checked',0)<self.httpCache.maxAge):
+            return entry['parsed']
+        headers = dict(header or {})
+        headers.update(self.httpCache.conditionalHeaders(entry))
+        try:
+            response = self.__send(call,headers)
+            if(response.status_code==304 and entry):
+                if(self.logger):
+                    self.logger.info('Not modified, served from cache: {}'.format(call))
+                return self.httpCache.touch(call)
+            raiseForRateLimit(call,response)
+            response.raise_for_status()
+        except (requests.exceptions.RequestException, RateLimitError) as req_err:
+            if(entry): #stale copy beats no data (or waiting out a rate limit) for near static endpoints
+                print('Request error, serving cached copy: {}'.format(req_err))
+                return entry['parsed']
+            raise #rate limits, 503s, timeouts are retried by sendRequest
+        if(self.logger):
+            self.logger.info('Request sent:{} Response code: {} cached'.format(call,response.status_code))
+        return self.httpCache.store(call,response)
+
     def __buildReq(self,call,**kwargs):
         '''constructs API query
         params---
@@ -101,7 +294,15 @@ class ApiHandler(object):
         if('format' not in kwargs):#return type
             kwargs['format']=self.__format
         query = urlencode(kwargs) #fit provided params to url query 
-        return "{}{}?{}".format(urls.BASE,call,query) #build into acceptable api call and return 
+        return self.__rebase("{}{}?{}".format(urls.BASE,call,query)) #build into acceptable api call and return 
+
+    def __rebase(self,url):
+        '''point url at baseUrl if one is set: scheme + host replaced, baseUrl path prefixed'''
+        if(not self.baseUrl):
+            return url
+        base = urlparse(self.baseUrl)
+        parsed = urlparse(url)
+        return parsed._replace(scheme=base.scheme,netloc=base.netloc,path=base.path.rstrip('/')+parsed.path).geturl()
 
     def fetchHeroes(self,**kwargs):
         '''
@@ -114,6 +315,7 @@ class ApiHandler(object):
         encoded call: url 
         '''
         url = self.__buildReq(urls.GET_HEROES,language=self.language,**kwargs) #build url 
+        self.__cachedUrls.add(url)
         if(self.logger):
             self.logger.info('URL built: {}'.format(url))
         return url  
@@ -121,6 +323,7 @@ class ApiHandler(object):
     def fetchHeroesDetailed(self,**kwargs):
         ''' Replacement for steam call to provide higher detailed data'''
         url = urls.DOTABUFF_HEROES_DETAILED
+        self.__cachedUrls.add(url)
         return url
 
     def fetchMatchHistoryBySeqNum(self,**kwargs):
@@ -148,7 +351,8 @@ class ApiHandler(object):
         returns---
         encoded call:url
         '''
-        url= "{}{}contents/{}?ref=master".format(urls.GIT_BASE,urls.DOTA2_CONSTANTS_REPO, urls.DOTA2_CONSTANTS_ITEMS)
+        url= self.__rebase("{}{}contents/{}?ref=master".format(urls.GIT_BASE,urls.DOTA2_CONSTANTS_REPO, urls.DOTA2_CONSTANTS_ITEMS))
+        self.__cachedUrls.add(url)
         if(self.logger):
             self.logger.info('URL built: {}'.format(url))
         return url
@@ -177,7 +381,7 @@ class ApiHandler(object):
 
         note: does not use __buildReq as no key required for opendota
         ''' 
-        url="{}{}?{}".format(urls.OPEN_DOTA_BASE,urls.GET_PUBLIC_MATCHES,urlencode(kwargs))
+        url=self.__rebase("{}{}?{}".format(urls.OPEN_DOTA_BASE,urls.GET_PUBLIC_MATCHES,urlencode(kwargs)))
         if (self.logger):
             self.logger.info('URL built: {}'.format(url))
         return url
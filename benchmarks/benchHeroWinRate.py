@@ -0,0 +1,40 @@
+'''compare getAllHeroesWinRateOverTime against calling getHeroWinRateOverTime once per hero
+needs a populated matches collection: MONGO_CONNECTION_STR env var
+run from repo root: python -m benchmarks.benchHeroWinRate [--interval day] [--db dota2] [--collection matches]
+'''
+import argparse
+import os
+import time
+import dbHandler
+
+def main():
+    parser=argparse.ArgumentParser('benchHeroWinRate')
+    parser.add_argument('--interval',type=str,default='day')
+    parser.add_argument('--db',type=str,default='dota2')
+    parser.add_argument('--collection',type=str,default='matches')
+    args=parser.parse_args()
+    db=dbHandler.dbHandler(os.getenv('MONGO_CONNECTION_STR'))
+    db.connect(dbName=args.db,collectionName=args.collection)
+    heroIds=sorted(set(db.collection.distinct('radiant_team'))|set(db.collection.distinct('dire_team')))
+
+    start=time.perf_counter()
+    single=db.getAllHeroesWinRateOverTime(interval=args.interval,useRollups=False)
+    singleElapsed=time.perf_counter()-start
+
+    start=time.perf_counter()
+    loop={}
+    for heroId in heroIds:
+        rows=db.getHeroWinRateOverTime(interval=args.interval,heroId=heroId,useRollups=False)
+        if(rows):
+            loop[heroId]=rows
+    loopElapsed=time.perf_counter()-start
+
+    print('heroes: {}'.format(len(heroIds)))
+    print('per hero loop: {:.2f}s'.format(loopElapsed))
+    print('single pass:   {:.2f}s'.format(singleElapsed))
+    print('speedup:       {:.1f}x'.format(loopElapsed/singleElapsed if singleElapsed else float('inf')))
+    print('results match: {}'.format(single==loop))
+    db.endSession()
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,207 @@
+'''parse + db write throughput of the ingest path on seeded synthetic payloads (see benchmarks.payloads)
+db benchmarks run against mongomock in process (default) or a local mongod: --backend mongod uses --conStr or MONGO_CONNECTION_STR
+each benchmark runs in a fresh process so peak RSS is its own, results are written as json for comparing runs
+run from repo root: python -m benchmarks.benchIngest [--iterations 50] [--batch 100] [--backend mongomock] [--compare previous.json]
+'''
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import contextlib
+import multiprocessing
+from datetime import datetime, timezone
+import parseData
+import dbHandler
+from benchmarks import payloads
+
+BENCH_DB='dota2_bench'
+
+def percentile(values,q):
+    '''nearest rank percentile (0-100) of values'''
+    ordered=sorted(values)
+    if(not ordered):
+        return None
+    return ordered[min(len(ordered)-1,max(0,int(round(q/100*len(ordered)+0.5))-1))]
+
+def peakRssKb():
+    '''peak resident set size of this process in KB'''
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak//1024 if sys.platform=='darwin' else peak #bytes on macOS, KB on linux
+
+def measure(fn,calls):
+    '''run fn(i) for i in range(calls), returning the latency of each call in seconds'''
+    latencies=[]
+    with contextlib.redirect_stdout(io.StringIO()): #dbHandler prints per call
+        for i in range(calls):
+            start=time.perf_counter()
+            fn(i)
+            latencies.append(time.perf_counter()-start)
+    return latencies
+
+def openDb(options,collectionName):
+    '''dbHandler on an empty benchmark collection with the declared indexes of matches'''
+    conStr=options['conStr'] or os.getenv('MONGO_CONNECTION_STR')
+    if(options['backend']=='mongomock'):
+        import mongomock
+        from unittest import mock
+        with mock.patch('dbHandler.MongoClient',mongomock.MongoClient):
+            db=dbHandler.dbHandler('mongodb://localhost')
+            db.connect(dbName=BENCH_DB,collectionName=collectionName)
+    else:
+        db=dbHandler.dbHandler(conStr)
+        db.connect(dbName=BENCH_DB,collectionName=collectionName)
+    db.collection.drop()
+    from indexSpecs import ensureIndexes, INDEX_SPECS
+    ensureIndexes(db.collection,specs=INDEX_SPECS['matches'],force=True)
+    return db
+
+def parsedBatches(options,count,overlap=0):
+    '''count batches of parsed OpenDota matches with unique ids, each sharing overlap matches with the previous one'''
+    parse=parseData.parseData()
+    step=options['batch']-overlap
+    return [parse.parsePublicMatchesOpenDota(payloads.publicMatches(options['batch'],seed=i,startId=payloads.FIRST_MATCH_ID+i*step)) for i in range(count)]
+
+#each benchmark: options -> (rows per call, per call latencies)
+def benchParseOpenDota(options):
+    parse=parseData.parseData()
+    page=payloads.publicMatches(options['batch'])
+    return options['batch'],measure(lambda i: parse.parsePublicMatchesOpenDota(page),options['iterations'])
+
+def benchParseSteam(options):
+    parse=parseData.parseData()
+    page=payloads.steamMatchPage(options['batch'])
+    return options['batch'],measure(lambda i: parse.parseMatchesSteam(page),options['iterations'])
+
+def benchIterSteam(options):
+    parse=parseData.parseData()
+    body=json.dumps(payloads.steamMatchPage(options['batch']))
+    return options['batch'],measure(lambda i: list(parse.iterMatchesSteam([body])),options['iterations'])
+
+def benchParseHeroes(options):
+    parse=parseData.parseData()
+    heroes=payloads.steamHeroes()
+    return len(heroes['result']['heroes']),measure(lambda i: parse.parseHeroesSteam(heroes),options['iterations'])
+
+def benchInsert(options):
+    db=openDb(options,'matches_bench_insert')
+    batches=parsedBatches(options,options['iterations'])
+    try:
+        return options['batch'],measure(lambda i: db.insertData(batches[i],True),options['iterations'])
+    finally:
+        db.collection.drop()
+        db.endSession()
+
+def benchIngest(options):
+    db=openDb(options,'matches_bench_ingest')
+    batches=parsedBatches(options,options['iterations'],overlap=options['batch']//2) #half of every poll already stored
+    try:
+        return options['batch'],measure(lambda i: db.ingestData(batches[i]),options['iterations'])
+    finally:
+        db.collection.drop()
+        db.endSession()
+
+def benchUpdate(options):
+    db=openDb(options,'matches_bench_update')
+    calls=options['iterations']*options['batch']
+    with contextlib.redirect_stdout(io.StringIO()):
+        for batch in parsedBatches(options,options['iterations']):
+            db.insertData(batch,True)
+    details=payloads.steamMatchPage(calls)['result']['matches']
+    def update(i):
+        detail=dict(details[i])
+        detail.pop('start_time')
+        detail['detailed']=True
+        db.updateData(detail,many=False,query={'match_seq_num':detail['match_seq_num']})
+    try:
+        return 1,measure(update,calls)
+    finally:
+        db.collection.drop()
+        db.endSession()
+
+def benchFlushUpdates(options):
+    db=openDb(options,'matches_bench_flush')
+    db.bulkSize=float('inf') #flush explicitly
+    with contextlib.redirect_stdout(io.StringIO()):
+        for batch in parsedBatches(options,options['iterations']):
+            db.insertData(batch,True)
+    details=payloads.steamMatchPage(options['iterations']*options['batch'])['result']['matches']
+    def flush(i):
+        for detail in details[i*options['batch']:(i+1)*options['batch']]:
+            detail=dict(detail)
+            detail.pop('start_time')
+            detail['detailed']=True
+            db.bufferUpdate(detail,query={'match_seq_num':detail['match_seq_num']})
+        db.flushUpdates()
+    try:
+        return options['batch'],measure(flush,options['iterations'])
+    finally:
+        db.collection.drop()
+        db.endSession()
+
+BENCHMARKS={
+    'parsePublicMatchesOpenDota':benchParseOpenDota,
+    'parseMatchesSteam':benchParseSteam,
+    'iterMatchesSteam':benchIterSteam,
+    'parseHeroesSteam':benchParseHeroes,
+    'insertData':benchInsert,
+    'ingestData':benchIngest,
+    'updateData':benchUpdate,
+    'flushUpdates':benchFlushUpdates,
+}
+
+def runBenchmark(name,options):
+    '''run one benchmark and summarise it
+    returns---
+    dict: {'name','rowsPerCall','calls','seconds','rowsPerSec','p50Ms','p99Ms','peakRssKb'}
+    '''
+    rows,latencies=BENCHMARKS[name](options)
+    total=sum(latencies)
+    return {'name':name,'rowsPerCall':rows,'calls':len(latencies),'seconds':round(total,4),
+            'rowsPerSec':round(rows*len(latencies)/total,1) if total else None,
+            'p50Ms':round(percentile(latencies,50)*1000,3),'p99Ms':round(percentile(latencies,99)*1000,3),
+            'peakRssKb':peakRssKb()}
+
+def main():
+    parser=argparse.ArgumentParser('benchIngest')
+    parser.add_argument('--only',type=str,nargs='+',default=list(BENCHMARKS),choices=list(BENCHMARKS),help='benchmarks to run')
+    parser.add_argument('--iterations',type=int,default=50,help='calls per benchmark')
+    parser.add_argument('--batch',type=int,default=100,help='matches per payload/write: 100 = one api page')
+    parser.add_argument('--backend',type=str,default='mongomock',choices=['mongomock','mongod'])
+    parser.add_argument('--conStr',type=str,default=None,help='mongod connection string: default MONGO_CONNECTION_STR')
+    parser.add_argument('--output',type=str,default=os.path.join('benchmarks','results'),help='directory results json is written to')
+    parser.add_argument('--compare',type=str,default=None,help='previous results json to compare rows/sec against')
+    parser.add_argument('--inProcess',action='store_true',default=False,help='run every benchmark in this process (peak RSS is then cumulative)')
+    args=parser.parse_args()
+    options={'iterations':args.iterations,'batch':args.batch,'backend':args.backend,'conStr':args.conStr}
+    results=[]
+    context=multiprocessing.get_context('spawn')
+    for name in args.only:
+        if(args.inProcess):
+            result=runBenchmark(name,options)
+        else:
+            with context.Pool(1) as pool:
+                result=pool.apply(runBenchmark,(name,options))
+        results.append(result)
+    previous={}
+    if(args.compare):
+        with open(args.compare,'r') as f:
+            previous={result['name']:result for result in json.load(f)['results']}
+    print('{:<28} {:>12} {:>10} {:>10} {:>11} {:>9}'.format('benchmark','rows/sec','p50 ms','p99 ms','peak RSS KB','vs prev'))
+    for result in results:
+        before=previous.get(result['name'])
+        change='{:.2f}x'.format(result['rowsPerSec']/before['rowsPerSec']) if before and before.get('rowsPerSec') and result['rowsPerSec'] else ''
+        print('{name:<28} {rowsPerSec:>12,.0f} {p50Ms:>10.3f} {p99Ms:>10.3f} {peakRssKb:>11,}'.format(**result)+' {:>9}'.format(change))
+    started=datetime.now(timezone.utc)
+    report={'started':started.isoformat(),'python':sys.version.split()[0],'platform':sys.platform,'options':options,'results':results}
+    report['options'].pop('conStr') #may hold credentials
+    os.makedirs(args.output,exist_ok=True)
+    path=os.path.join(args.output,'ingest_{}.json'.format(started.strftime('%Y%m%dT%H%M%S')))
+    with open(path,'w') as f:
+        json.dump(report,f,indent=2)
+    print('Results written to {}'.format(path))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,56 @@
+'''compare parsePublicMatchesOpenDota against the original row-wise implementation
+run from repo root: python -m benchmarks.benchParse [--sizes 100 1000 10000 100000] [--repeat 3]
+'''
+import argparse
+import time
+from time import strftime, localtime
+import pandas as pd
+import parseData
+from benchmarks import payloads
+
+def legacyParsePublicMatchesOpenDota(jsonDump):
+    '''original implementation: three .loc filters + DataFrame.apply per row'''
+    matches = pd.DataFrame.from_dict(jsonDump)
+    matches = matches.loc[matches['game_mode']==22]
+    matches = matches.loc[(matches['lobby_type']==7)| (matches['lobby_type']==6) ]
+    matches = matches.loc[matches['duration']>900]
+    matches['start_time']=matches.apply(lambda row: strftime('%Y-%m-%d %H:%M:%S',localtime(row['start_time'])),axis=1)
+    return matches.to_dict(orient='records')
+
+def vectorizedParsePublicMatchesOpenDota(jsonDump):
+    '''column wise DataFrame variant: one boolean mask + vectorized epoch conversion, kept to show the crossover never comes'''
+    matches = pd.DataFrame.from_dict(jsonDump)
+    mask = (matches['game_mode']==parseData.RANKED_GAME_MODE) & matches['lobby_type'].isin(parseData.RANKED_LOBBY_TYPES) & (matches['duration']>parseData.MIN_DURATION)
+    matches = matches.loc[mask].copy()
+    startTimes=pd.to_datetime(matches['start_time'],unit='s',utc=True)
+    matches['start_time']=pd.Series(list(startTimes.dt.to_pydatetime()),dtype=object,index=matches.index)
+    return matches.to_dict(orient='records')
+
+def timeIt(fn,payload,repeat):
+    '''best of repeat runs in seconds'''
+    best=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        fn(payload)
+        elapsed=time.perf_counter()-start
+        best=elapsed if best is None else min(best,elapsed)
+    return best
+
+def main():
+    parser=argparse.ArgumentParser('benchParse')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[100,1000,10000,100000])
+    parser.add_argument('--repeat',type=int,default=3)
+    args=parser.parse_args()
+    parse=parseData.parseData()
+    impls=[('legacy',legacyParsePublicMatchesOpenDota),('vectorized',vectorizedParsePublicMatchesOpenDota),('current',parse.parsePublicMatchesOpenDota)]
+    print('{:>8} {:>12} {:>14} {:>9}'.format('rows','impl','rows/sec','speedup'))
+    for size in args.sizes:
+        payload=payloads.publicMatches(size)
+        baseline=None
+        for name,fn in impls:
+            elapsed=timeIt(fn,payload,args.repeat)
+            baseline=baseline or elapsed
+            print('{:>8} {:>12} {:>14,.0f} {:>8.1f}x'.format(size,name,size/elapsed,baseline/elapsed))
+
+if __name__=='__main__':
+    main()
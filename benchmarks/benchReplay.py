@@ -0,0 +1,109 @@
+'''sustained matches/sec of the scheduler jobs against a local replayServer with injected latency + failures
+db writes go to mongomock in process (default) or a mongod: --backend mongod uses MONGO_CONNECTION_STR
+run from repo root: python -m benchmarks.benchReplay --job steam [--duration 60] [--latency lognormal 80 0.6] [--rate429 0.05] [--retryAfter 1]
+jobs---
+    steam: cyclePopulateMatches(Steam) following the crawl position, as the scheduler's Steam job does
+    opendota: cyclePopulateMatches(OpenDota) back to back
+    merge: mergeMatches over matches inserted by an initial opendota populate
+    pipeline: seqCrawler.pipelineCrawl over the replay backlog
+'''
+import io
+import os
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime, timezone
+from unittest import mock
+from benchmarks import replayServer
+
+def collectionCount(name,query=None):
+    import connectionManager
+    return connectionManager.getManager(os.getenv('MONGO_CONNECTION_STR')).collection('dota2',name).count_documents(query or {})
+
+def runSteam(args,deadline,api):
+    import scheduler
+    import checkpoint
+    cursor=checkpoint.CrawlCursor('replay')
+    while time.monotonic()<deadline:
+        batch=scheduler.cyclePopulateMatches(False,'Steam',cursor.position,api=api)
+        cursor.advance(batch)
+
+def runOpenDota(args,deadline,api):
+    import scheduler
+    while time.monotonic()<deadline:
+        scheduler.cyclePopulateMatches(False,'OpenDota',api=api)
+
+def runMerge(args,deadline,api):
+    import scheduler
+    for _ in range(args.seedPolls): #undetailed matches to merge
+        scheduler.cyclePopulateMatches(False,'OpenDota',api=api)
+    while time.monotonic()<deadline:
+        stats=scheduler.mergeMatches(False,args.workers,args.batchSize,api=api)
+        if(not stats or not stats['received']):
+            break
+
+def runPipeline(args,deadline,api): #pipelineCrawl sizes its own pool to the fetch workers
+    import seqCrawler
+    from benchmarks import payloads
+    with tempfile.TemporaryDirectory() as checkpointDir: #fresh crawl every run
+        seqCrawler.pipelineCrawl(payloads.FIRST_SEQ_NUM,payloads.FIRST_SEQ_NUM+args.backlog,fetchWorkers=args.workers,checkpointDir=checkpointDir)
+
+JOBS={'steam':runSteam,'opendota':runOpenDota,'merge':runMerge,'pipeline':runPipeline}
+#what each job's throughput is measured on: (collection, query)
+MEASURED={'steam':('matches_steam',None),'opendota':('matches',None),'merge':('matches',{'detailed':True}),'pipeline':('matches_steam',None)}
+
+def main():
+    parser=argparse.ArgumentParser('benchReplay')
+    parser.add_argument('--job',type=str,default='steam',choices=list(JOBS))
+    parser.add_argument('--duration',type=float,default=60,help='seconds to run the job for (pipeline runs to completion)')
+    parser.add_argument('--backend',type=str,default='mongomock',choices=['mongomock','mongod'])
+    parser.add_argument('--workers',type=int,default=8,help='merge/pipeline fetch workers')
+    parser.add_argument('--batchSize',type=int,default=1000,help='merge bulk write size')
+    parser.add_argument('--seedPolls',type=int,default=5,help='merge: opendota polls inserting matches to merge')
+    parser.add_argument('--output',type=str,default=None,help='write the report as json to this file')
+    replayServer.addServerArguments(parser)
+    args=parser.parse_args()
+
+    server=replayServer.serverFromArguments(args)
+    os.environ['DOTA2_API_BASE_URL']=server.start() #every ApiHandler the jobs create talks to the replay server
+    import apiHandler
+    api=apiHandler.ApiHandler() #one pooled handler shared by every job run, as the scheduler does
+    patches=[]
+    if(args.backend=='mongomock'):
+        import mongomock
+        client=mongomock.MongoClient()
+        factory=lambda *a,**kw: client #one in memory server shared by every handler
+        os.environ.setdefault('MONGO_CONNECTION_STR','mongodb://localhost')
+        patches=[mock.patch('dbHandler.MongoClient',factory),mock.patch('connectionManager.MongoClient',factory)]
+    for patch in patches:
+        patch.start()
+    try:
+        collection,query=MEASURED[args.job]
+        before=collectionCount(collection,query)
+        start=time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()): #jobs print per batch
+            JOBS[args.job](args,start+args.duration,api)
+        elapsed=time.monotonic()-start
+        after=collectionCount(collection,query)
+    finally:
+        api.close()
+        for patch in patches:
+            patch.stop()
+        server.stop()
+    served=server.stats()
+    report={'started':datetime.now(timezone.utc).isoformat(),'job':args.job,'backend':args.backend,'elapsed':round(elapsed,2),
+            'latency':args.latency,'rate429':args.rate429,'rate503':args.rate503,'retryAfter':args.retryAfter,
+            'matchesStored':after-before,'matchesServed':served['matches'],
+            'matchesPerSec':round((after-before)/elapsed,1) if elapsed else None,
+            'servedPerSec':round(served['matches']/elapsed,1) if elapsed else None,
+            'requests':served['requests'],'status':served['status'],'bytes':served['bytes']}
+    print('{job}: {matchesStored} matches stored in {elapsed}s = {matchesPerSec} matches/sec ({servedPerSec}/sec served, {requests} requests, status {status})'.format(**report))
+    if(args.output):
+        with open(args.output,'w') as f:
+            json.dump(report,f,indent=2)
+    return report
+
+if __name__=='__main__':
+    main()
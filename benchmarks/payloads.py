@@ -0,0 +1,123 @@
+'''seeded generators of realistic api payloads for benchmarks
+the same (count, seed) always produces the same payload so runs can be compared
+'''
+import random
+
+HERO_IDS=list(range(1,139))
+ITEM_IDS=list(range(1,300))
+FIRST_MATCH_ID=7000000000
+FIRST_SEQ_NUM=6000000000
+FIRST_START_TIME=1700000000
+
+def publicMatches(count,seed=0,startId=FIRST_MATCH_ID):
+    '''OpenDota /publicMatches style payload: list of summary matches
+    params---
+    count: int: number of matches
+    seed: int
+    startId: int: match_id of the first match, match_seq_num/start_time follow it
+    returns---
+    list of dict
+    '''
+    rng=random.Random(seed)
+    matches=[]
+    for i in range(count):
+        picks=rng.sample(HERO_IDS,10)
+        matches.append({
+            'match_id':startId+i,
+            'match_seq_num':FIRST_SEQ_NUM+(startId-FIRST_MATCH_ID)+i,
+            'radiant_win':rng.random()<0.5,
+            'start_time':FIRST_START_TIME+(startId-FIRST_MATCH_ID+i)*3,
+            'duration':rng.randint(600,4000),
+            'lobby_type':rng.choice([0,6,7,7,7]),
+            'game_mode':rng.choice([22,22,22,23,18]),
+            'avg_rank_tier':rng.randint(10,85),
+            'num_rank_tier':rng.randint(1,10),
+            'cluster':rng.randint(100,300),
+            'radiant_team':picks[:5],
+            'dire_team':picks[5:],
+        })
+    return matches
+
+def player(rng,slot,heroId,duration):
+    '''one entry of a detailed match's players array'''
+    minutes=duration/60
+    return {
+        'account_id':rng.randint(1,2**31),
+        'player_slot':slot,
+        'team_number':0 if slot<128 else 1,
+        'team_slot':slot%128,
+        'hero_id':heroId,
+        'hero_variant':rng.randint(1,3),
+        **{'item_{}'.format(i):rng.choice(ITEM_IDS) for i in range(6)},
+        **{'backpack_{}'.format(i):rng.choice([0]+ITEM_IDS) for i in range(3)},
+        'item_neutral':rng.randint(0,400),
+        'kills':rng.randint(0,25),
+        'deaths':rng.randint(0,15),
+        'assists':rng.randint(0,30),
+        'leaver_status':0,
+        'last_hits':int(rng.uniform(1,9)*minutes),
+        'denies':rng.randint(0,40),
+        'gold_per_min':rng.randint(200,900),
+        'xp_per_min':rng.randint(250,1100),
+        'level':rng.randint(8,30),
+        'net_worth':rng.randint(3000,45000),
+        'aghanims_scepter':rng.randint(0,1),
+        'aghanims_shard':rng.randint(0,1),
+        'moonshard':0,
+        'hero_damage':rng.randint(2000,70000),
+        'tower_damage':rng.randint(0,15000),
+        'hero_healing':rng.randint(0,10000),
+        'gold':rng.randint(0,5000),
+        'gold_spent':rng.randint(5000,50000),
+        'ability_upgrades':[{'ability':rng.randint(5000,9000),'time':int(t*duration/25),'level':t+1} for t in range(rng.randint(10,25))],
+    }
+
+def detailedMatch(rng,matchId,seqNum):
+    '''GetMatchHistoryBySequenceNum/GetMatchDetails style match including its 10 players'''
+    duration=rng.randint(600,4000)
+    picks=rng.sample(HERO_IDS,10)
+    return {
+        'players':[player(rng,slot,heroId,duration) for slot,heroId in zip([0,1,2,3,4,128,129,130,131,132],picks)],
+        'radiant_win':rng.random()<0.5,
+        'duration':duration,
+        'pre_game_duration':90,
+        'start_time':FIRST_START_TIME+(seqNum-FIRST_SEQ_NUM)*3,
+        'match_id':matchId,
+        'match_seq_num':seqNum,
+        'tower_status_radiant':rng.randint(0,2047),
+        'tower_status_dire':rng.randint(0,2047),
+        'barracks_status_radiant':rng.randint(0,63),
+        'barracks_status_dire':rng.randint(0,63),
+        'cluster':rng.randint(100,300),
+        'first_blood_time':rng.randint(0,300),
+        'lobby_type':rng.choice([0,6,7,7,7]),
+        'human_players':10,
+        'leagueid':0,
+        'game_mode':rng.choice([22,22,22,23,18]),
+        'flags':1,
+        'engine':1,
+        'radiant_score':rng.randint(5,60),
+        'dire_score':rng.randint(5,60),
+    }
+
+def steamMatchPage(count=100,seed=0,startSeq=FIRST_SEQ_NUM):
+    '''SteamAPI GetMatchHistoryBySequenceNum response with count detailed matches
+    returns---
+    dict: {'result':{'status':1,'matches':[...]}}
+    '''
+    rng=random.Random(seed)
+    matches=[detailedMatch(rng,FIRST_MATCH_ID+(startSeq-FIRST_SEQ_NUM)+i,startSeq+i) for i in range(count)]
+    return {'result':{'status':1,'matches':matches}}
+
+def steamHeroes(count=124,seed=0):
+    '''SteamAPI GetHeroes response
+    returns---
+    dict: {'result':{'heroes':[{'name','id'}],'status':200,'count'}}
+    '''
+    rng=random.Random(seed)
+    syllables=['ab','ax','bel','cor','da','en','fal','gor','hu','ix','jak','kel','lo','mor','nyx','or','pa','qu','ra','sy','tor','ur','vex','wy','zen']
+    heroes=[]
+    for i in range(count):
+        name=''.join(rng.choice(syllables) for _ in range(rng.randint(2,4)))
+        heroes.append({'name':'npc_dota_hero_{}_{}'.format(name,i),'id':HERO_IDS[i%len(HERO_IDS)]})
+    return {'result':{'heroes':heroes,'status':200,'count':count}}
@@ -0,0 +1,261 @@
+'''local stand-in for the Steam/OpenDota/GitHub routes ApiHandler calls, for load testing without burning quota
+point ApiHandler at it with baseUrl= or the DOTA2_API_BASE_URL env var
+run from repo root: python -m benchmarks.replayServer [--port 8099] [--latency lognormal 80 0.6] [--rate429 0.05] [--rate503 0.01] [--retryAfter 2]
+'''
+import os
+import json
+import math
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from benchmarks import payloads
+
+#route name -> substring of the request path identifying it
+ROUTES=OrderedDict([
+    ('matchHistory','GetMatchHistoryBySequenceNum'),
+    ('matchDetails','GetMatchDetails'),
+    ('heroes','GetHeroes'),
+    ('publicMatches','publicMatches'),
+    ('contents','/contents/'),
+])
+
+class Latency(object):
+    def __init__(self,kind='fixed',*params):
+        '''response delay distribution in milliseconds
+        params---
+            kind: str: fixed (ms) | uniform (low ms, high ms) | lognormal (median ms, sigma)
+        '''
+        if(kind not in ('fixed','uniform','lognormal')):
+            raise ValueError('Unknown latency distribution: {}'.format(kind))
+        self.kind=kind
+        self.params=[float(p) for p in params] or [0.0]
+
+    def sample(self,rng):
+        '''delay in seconds'''
+        if(self.kind=='uniform'):
+            return rng.uniform(self.params[0],self.params[1])/1000
+        if(self.kind=='lognormal'):
+            return rng.lognormvariate(math.log(max(self.params[0],1e-3)),self.params[1] if len(self.params)>1 else 0.5)/1000
+        return self.params[0]/1000
+
+class ReplayData(object):
+    def __init__(self,matchesPerSec=10,backlog=100000,recordDir=None):
+        '''synthetic (or recorded) responses: the same id/sequence number always yields the same match
+        new matches appear at the live head of the sequence at matchesPerSec
+        params---
+            matchesPerSec: float: rate the live head advances
+            backlog: int: matches already available when the server starts
+            recordDir: str: directory of recorded responses <route>.json served verbatim instead of synthetic data
+        '''
+        self.matchesPerSec=matchesPerSec
+        self.backlog=backlog
+        self.recordDir=recordDir
+        self.started=time.monotonic()
+        self.__pages=OrderedDict() #(start, count) -> body of pages fully below the head
+        self.__lock=threading.Lock()
+
+    def headSeq(self):
+        '''first match_seq_num not played yet'''
+        return payloads.FIRST_SEQ_NUM+self.backlog+int((time.monotonic()-self.started)*self.matchesPerSec)
+
+    def headMatchId(self):
+        return payloads.FIRST_MATCH_ID+(self.headSeq()-payloads.FIRST_SEQ_NUM)
+
+    def recorded(self,route):
+        '''body of a recorded response for route or None'''
+        if(not self.recordDir):
+            return None
+        path=os.path.join(self.recordDir,'{}.json'.format(route))
+        if(not os.path.exists(path)):
+            return None
+        with open(path,'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def match(seq):
+        return payloads.detailedMatch(random.Random(seq),payloads.FIRST_MATCH_ID+(seq-payloads.FIRST_SEQ_NUM),seq)
+
+    def matchHistory(self,query):
+        '''GetMatchHistoryBySequenceNum: up to matches_requested (max 100) matches from start_at_match_seq_num'''
+        start=max(int(query.get('start_at_match_seq_num',payloads.FIRST_SEQ_NUM)),payloads.FIRST_SEQ_NUM)
+        count=min(int(query.get('matches_requested',100)),100)
+        end=min(start+count,self.headSeq())
+        key=(start,count)
+        with self.__lock:
+            body=self.__pages.get(key)
+        if(body is None):
+            body=json.dumps({'result':{'status':1,'matches':[self.match(seq) for seq in range(start,end)]}}).encode('utf-8')
+            if(end==start+count): #complete pages never change
+                with self.__lock:
+                    self.__pages[key]=body
+                    while(len(self.__pages)>256):
+                        self.__pages.popitem(last=False)
+        return body,max(0,end-start)
+
+    def matchDetails(self,query):
+        matchId=int(query.get('match_id',payloads.FIRST_MATCH_ID))
+        seq=payloads.FIRST_SEQ_NUM+(matchId-payloads.FIRST_MATCH_ID)
+        if(seq<payloads.FIRST_SEQ_NUM or seq>=self.headSeq()):
+            return json.dumps({'result':{'error':'Match ID not found'}}).encode('utf-8'),0
+        return json.dumps({'result':self.match(seq)}).encode('utf-8'),1
+
+    def publicMatches(self,query):
+        '''/publicMatches: newest 100 matches below less_than_match_id within min_rank..max_rank'''
+        matchId=min(int(query.get('less_than_match_id',self.headMatchId())),self.headMatchId())
+        minRank=int(query.get('min_rank',0))
+        maxRank=int(query.get('max_rank',100))
+        matches=[]
+        while(len(matches)<100 and matchId>payloads.FIRST_MATCH_ID):
+            matchId-=1
+            match=payloads.publicMatches(1,seed=matchId,startId=matchId)[0]
+            if(minRank<=match['avg_rank_tier']<=maxRank):
+                matches.append(match)
+        return json.dumps(matches).encode('utf-8'),len(matches)
+
+    def heroes(self,query):
+        return json.dumps(payloads.steamHeroes()).encode('utf-8'),0
+
+    def contents(self,query):
+        '''GitHub contents api: file body base64 encoded'''
+        items={str(i):{'id':i,'dname':'Item {}'.format(i),'cost':random.Random(i).randint(0,6000)} for i in payloads.ITEM_IDS}
+        content=base64.b64encode(json.dumps(items).encode('utf-8')).decode('ascii')
+        return json.dumps({'name':'items.json','path':'build/items.json','encoding':'base64','content':content}).encode('utf-8'),0
+
+class ReplayServer(object):
+    def __init__(self,host='127.0.0.1',port=8099,latency=None,rate429=0.0,rate503=0.0,retryAfter=None,data=None,seed=0):
+        '''threaded http server answering ApiHandler's routes with injected latency + failures
+        params---
+            host/port: where to listen, port 0 picks a free port
+            latency: Latency: delay before every response: default none
+            rate429: float: fraction of requests answered 429 Too Many Requests
+            rate503: float: fraction of requests answered 503 Service Unavailable
+            retryAfter: float: seconds sent in Retry-After with 429/503: default header omitted
+            data: ReplayData: default synthetic data
+            seed: int: seeds latency + failure draws
+        '''
+        self.latency=latency or Latency('fixed',0)
+        self.rate429=rate429
+        self.rate503=rate503
+        self.retryAfter=retryAfter
+        self.data=data or ReplayData()
+        self.rng=random.Random(seed)
+        self.__rngLock=threading.Lock()
+        self.__statsLock=threading.Lock()
+        self.counts={'requests':0,'matches':0,'bytes':0,'status':{},'routes':{}}
+        server=self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version='HTTP/1.1' #keep-alive like the real apis
+            def do_GET(self):
+                server.handle(self)
+            def log_message(self,format,*args):
+                pass
+        self.httpd=ThreadingHTTPServer((host,port),Handler)
+        self.httpd.daemon_threads=True
+        self.thread=None
+
+    @property
+    def url(self):
+        host,port=self.httpd.server_address[:2]
+        return 'http://{}:{}'.format(host,port)
+
+    def draw(self):
+        '''(delay seconds, injected status or None)'''
+        with self.__rngLock:
+            delay=self.latency.sample(self.rng)
+            roll=self.rng.random()
+        if(roll<self.rate429):
+            return delay,429
+        if(roll<self.rate429+self.rate503):
+            return delay,503
+        return delay,None
+
+    def record(self,route,status,matches=0,size=0):
+        with self.__statsLock:
+            self.counts['requests']+=1
+            self.counts['matches']+=matches
+            self.counts['bytes']+=size
+            self.counts['status'][status]=self.counts['status'].get(status,0)+1
+            self.counts['routes'][route]=self.counts['routes'].get(route,0)+1
+
+    def handle(self,request):
+        parsed=urlparse(request.path)
+        route=next((name for name,marker in ROUTES.items() if marker in parsed.path),None)
+        delay,injected=self.draw()
+        if(delay>0):
+            time.sleep(delay)
+        if(route is None):
+            return self.respond(request,'unknown',404,b'{"error":"not found"}')
+        if(injected):
+            headers={'Retry-After':str(int(math.ceil(self.retryAfter)))} if self.retryAfter is not None else {}
+            return self.respond(request,route,injected,b'{"error":"injected"}',headers)
+        query={key:values[-1] for key,values in parse_qs(parsed.query).items()}
+        body=self.data.recorded(route)
+        matches=0
+        if(body is None):
+            body,matches=getattr(self.data,route)(query)
+        etag='"{}"'.format(hashlib.sha1(body).hexdigest())
+        if(route in ('heroes','contents') and request.headers.get('If-None-Match')==etag): #conditional requests of near static routes
+            return self.respond(request,route,304,b'',{'ETag':etag})
+        return self.respond(request,route,200,body,{'ETag':etag},matches)
+
+    def respond(self,request,route,status,body,headers=None,matches=0):
+        request.send_response(status)
+        request.send_header('Content-Type','application/json; charset=utf-8')
+        request.send_header('Content-Length',str(len(body)))
+        for key,value in (headers or {}).items():
+            request.send_header(key,value)
+        request.end_headers()
+        if(body):
+            request.wfile.write(body)
+        self.record(route,status,matches,len(body))
+
+    def stats(self):
+        '''counts so far: {'requests','matches','bytes','status':{code:n},'routes':{route:n}}'''
+        with self.__statsLock:
+            return json.loads(json.dumps(self.counts))
+
+    def start(self):
+        '''serve from a daemon thread
+        returns---
+        str: base url to pass to ApiHandler(baseUrl=)
+        '''
+        self.thread=threading.Thread(target=self.httpd.serve_forever,name='replayServer',daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def addServerArguments(parser):
+    '''replay server options shared by the server cli and benchmarks.benchReplay'''
+    parser.add_argument('--latency',type=str,nargs='+',default=['fixed','0'],help='fixed MS | uniform LOW HIGH | lognormal MEDIAN SIGMA')
+    parser.add_argument('--rate429',type=float,default=0.0,help='fraction of requests answered 429')
+    parser.add_argument('--rate503',type=float,default=0.0,help='fraction of requests answered 503')
+    parser.add_argument('--retryAfter',type=float,default=None,help='Retry-After seconds sent with 429/503')
+    parser.add_argument('--matchesPerSec',type=float,default=10,help='rate new matches appear at the live head')
+    parser.add_argument('--backlog',type=int,default=100000,help='matches available at start')
+    parser.add_argument('--recordDir',type=str,default=None,help='directory of recorded <route>.json responses')
+    parser.add_argument('--seed',type=int,default=0)
+
+def serverFromArguments(args,port=0):
+    return ReplayServer(port=port,latency=Latency(*args.latency),rate429=args.rate429,rate503=args.rate503,retryAfter=args.retryAfter,
+                        data=ReplayData(matchesPerSec=args.matchesPerSec,backlog=args.backlog,recordDir=args.recordDir),seed=args.seed)
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser('replayServer')
+    parser.add_argument('--port',type=int,default=8099)
+    addServerArguments(parser)
+    args=parser.parse_args()
+    server=serverFromArguments(args,port=args.port)
+    print('Replay server on {} (export DOTA2_API_BASE_URL={})'.format(server.url,server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats())
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+
+class Checkpoint(object):
+    def __init__(self,path):
+        '''small json state file that is replaced atomically on every save
+        params---
+            path: str: file to persist state to, parent directories are created if needed
+        '''
+        self.path=path
+        directory=os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory,exist_ok=True)
+
+    def load(self,default=None):
+        '''read persisted state
+        params---
+        default: returned if nothing has been saved yet
+        returns---
+        state: dict
+        '''
+        try:
+            with open(self.path,'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+        except ValueError as err:
+            print('Corrupt checkpoint {}: {}'.format(self.path,err))
+            return default
+
+    def save(self,state):
+        '''write state to a temp file in the same directory then rename over the old file
+        a crash mid write leaves the previous checkpoint intact
+        params---
+        state: dict: json serialisable
+        '''
+        directory=os.path.dirname(os.path.abspath(self.path))
+        fd,tmpPath=tempfile.mkstemp(dir=directory,prefix='.tmp_',suffix='.json')
+        try:
+            with os.fdopen(fd,'w') as f:
+                json.dump(state,f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmpPath,self.path)
+        except Exception:
+            if(os.path.exists(tmpPath)):
+                os.remove(tmpPath)
+            raise
+
+class CrawlCursor(object):
+    def __init__(self,name,checkpoint=None,collection=None,key='match_seq_num'):
+        '''crawl position held in memory and persisted after every successful batch
+        params---
+            name: str: identifies the crawl e.g. 'steam'
+            checkpoint: Checkpoint: persist to a local json file
+            collection: pymongo collection: persist to a tiny dedicated collection instead (one doc per cursor)
+            key: str: field of inserted documents the position is derived from
+        '''
+        self.name=name
+        self.checkpoint=checkpoint
+        self.collection=collection
+        self.key=key
+        self.position=None
+
+    def load(self,seed=None):
+        '''restore position from the store, falling back to seed if nothing was persisted yet
+        params---
+        seed: callable returning the last stored value of key (e.g. max match_seq_num in db) or None: only called when store is empty
+        returns---
+        position: int or None
+        '''
+        state=None
+        if(self.collection is not None):
+            state=self.collection.find_one({'_id':self.name})
+        elif(self.checkpoint is not None):
+            state=self.checkpoint.load()
+        if(state and state.get('position') is not None):
+            self.position=state['position']
+        elif(seed is not None):
+            last=seed()
+            if(last is not None):
+                self.position=last+1
+                self.save()
+        return self.position
+
+    def save(self):
+        '''persist current position: atomic file replace or single document upsert'''
+        state={'position':self.position}
+        if(self.collection is not None):
+            self.collection.replace_one({'_id':self.name},state,upsert=True)
+        elif(self.checkpoint is not None):
+            self.checkpoint.save(state)
+
+    def advance(self,batch):
+        '''move position past the last successfully inserted batch
+        params---
+        batch: list of dict: inserted documents
+        returns---
+        position: int
+        '''
+        values=[doc[self.key] for doc in batch if doc.get(self.key) is not None] if batch else []
+        if(values):
+            self.position=max(max(values)+1,self.position or 0)
+            self.save()
+        return self.position
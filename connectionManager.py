@@ -0,0 +1,120 @@
+import os
+import atexit
+import threading
+from pymongo import MongoClient, errors
+
+class ConnectionManager(object):
+    def __init__(self,conStr,maxPoolSize=50,minPoolSize=0,serverSelectionTimeoutMS=10000,logging=None):
+        '''one pooled MongoClient shared by every job in the process
+        params---
+            conStr: mongodb connection string/uri: str
+            maxPoolSize: int: max open connections kept by the client
+            minPoolSize: int: connections kept open even when idle
+            serverSelectionTimeoutMS: int: how long an operation waits for a usable server (e.g. during failover)
+            logging: enable logs
+        '''
+        self.conStr=conStr
+        self.options={'maxPoolSize':maxPoolSize,'minPoolSize':minPoolSize,'serverSelectionTimeoutMS':serverSelectionTimeoutMS,
+                      'retryWrites':True,'retryReads':True}
+        self.client=None
+        self.__pid=None
+        self.__lock=threading.Lock()
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def getClient(self):
+        '''return the shared client, creating it on first use or after a fork (clients are not fork safe)
+        returns---
+        MongoClient
+        '''
+        with self.__lock:
+            if(self.client is None or self.__pid!=os.getpid()):
+                self.client=MongoClient(self.conStr,**self.options)
+                self.__pid=os.getpid()
+                if(self.logger):
+                    self.logger.info('Shared client created: {}'.format(self.options))
+            return self.client
+
+    def collection(self,dbName,collectionName):
+        '''collection handle backed by the shared client'''
+        return self.getClient()[dbName][collectionName]
+
+    def warmUp(self,connections=None):
+        '''open connections ahead of the first job so it does not pay for setup
+        params---
+        connections: int: number of concurrent pings: default minPoolSize or 1
+        returns---
+        bool: True if the server answered
+        '''
+        client=self.getClient()
+        connections=connections or self.options['minPoolSize'] or 1
+        results=[]
+        def ping():
+            try:
+                client.admin.command('ping')
+                results.append(True)
+            except errors.PyMongoError as err:
+                print('Warm up failed: {}'.format(err))
+                results.append(False)
+        threads=[threading.Thread(target=ping) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return all(results)
+
+    def healthCheck(self):
+        '''ping the server, replacing the client if it stays unreachable past server selection
+        pymongo already follows replica set failover, this covers clients left in a broken state
+        returns---
+        bool: True if healthy (possibly after reconnecting)
+        '''
+        try:
+            self.getClient().admin.command('ping')
+            return True
+        except errors.PyMongoError as err:
+            print('Health check failed, reconnecting: {}'.format(err))
+        self.close()
+        try:
+            self.getClient().admin.command('ping')
+            return True
+        except errors.PyMongoError as err:
+            print('Reconnect failed: {}'.format(err))
+            return False
+
+    def close(self):
+        '''close the shared client: next getClient creates a new one'''
+        with self.__lock:
+            if(self.client is not None and self.__pid==os.getpid()):
+                self.client.close()
+                if(self.logger):
+                    self.logger.info('Shared client closed')
+            self.client=None
+
+_managers={}
+_managersLock=threading.Lock()
+
+def getManager(conStr,**options):
+    '''process wide manager for a connection string: options only apply to the first call
+    params---
+    conStr: mongodb connection string/uri: str
+    options: see ConnectionManager
+    returns---
+    ConnectionManager
+    '''
+    with _managersLock:
+        if(conStr not in _managers):
+            _managers[conStr]=ConnectionManager(conStr,**options)
+        return _managers[conStr]
+
+def closeAll():
+    '''close every shared client: registered to run at interpreter exit'''
+    with _managersLock:
+        for manager in _managers.values():
+            manager.close()
+
+atexit.register(closeAll)
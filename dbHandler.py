@@ -1,14 +1,34 @@
-from pymongo import MongoClient, errors
+import time
+from datetime import datetime, timezone
+from pymongo import MongoClient, errors, UpdateOne
 
 from bson.son import SON
+from bson.objectid import ObjectId
+from rollups import RollupManager
+import connectionManager
+from queryCache import cached, invalidates, defaultCache
+from indexSpecs import INDEX_SPECS, ensureIndexes, indexDrift, checkPlans
+import seenFilter
+import workQueue
+import metrics
+
+LEGACY_TIME_FORMAT='%Y-%m-%d %H:%M:%S' #start_time strings written before it was stored as a date
+timed=metrics.instrumented(metrics.DB_SECONDS,metrics.DB_CALLS) #latency + calls by status of write/query methods
 #retry library
 from tenacity import retry,stop_after_attempt, wait_exponential, retry_if_exception_type
 class dbHandler(object):
-    def __init__(self,conStr,logging=None):
+    def __init__(self,conStr,logging=None,bulkSize=1000,bulkInterval=10,rollups=False,shared=False,cache=None,seen=None,queue=None):
         '''params---
             conStr: mongodb connection string/uri: str 
             dbName: name of db to connect to: str
             collectionName: name of collection within db to connect to: str
+            bulkSize: int: buffered updates are flushed once this many are queued
+            bulkInterval: float: buffered updates are flushed once this many seconds passed since last flush
+            rollups: bool: maintain per day/per hero rollups on insert and serve win rate queries from them
+            shared: bool: use the process wide pooled client (see connectionManager) instead of opening + closing a client
+            cache: queryCache.QueryCache or True for the process wide cache: caches analytics query results, dropped on writes to the collection
+            seen: seenFilter.RecentIdFilter or True for the process wide filter of the collection: ids ingestData skips without a round trip
+            queue: workQueue.WorkQueue or True for the db's match queue: new documents of ingestData are queued for detail merging: None/False: not queued
 
             attr- client db and collection to be assigned once connection established
             '''
@@ -18,6 +38,16 @@ class dbHandler(object):
         self.client=None 
         self.db=None
         self.collection=None 
+        self.bulkSize=bulkSize
+        self.bulkInterval=bulkInterval
+        self.__bulkOps=[]
+        self.__lastFlush=time.monotonic()
+        self.useRollups=rollups
+        self.shared=shared
+        self.cache=defaultCache if cache is True else (cache or None)
+        self.rollups=None
+        self.seen=seen or None #False = no filter
+        self.queue=queue or None #False = no queue
         if(logging):
             import logging
             logging.basicConfig(level=logging.NOTSET)
@@ -27,18 +57,23 @@ class dbHandler(object):
     @retry(
         stop=stop_after_attempt(3), #retry limit
         wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError,errors.PyMongoError))
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError,errors.PyMongoError)),
+        before_sleep=metrics.countRetry #count retries per method
     )
     def connect(self, dbName=None, collectionName=None, id=None):
         '''create connection to mongodb server, assigns client db and collection of dbHandler class
         params---
         id: str: name of field to be used if unique index required
+            declared indexes of the collection (see indexSpecs) are created alongside it, once per process
         dbName: str: name of db
         collectionName:str name of collection to use
         '''
         try:
             
-            self.client=MongoClient(self.conStr)
+            if(self.shared):
+                self.client=connectionManager.getManager(self.conStr).getClient()
+            else:
+                self.client=MongoClient(self.conStr)
             if(dbName is not None):
                 self.dbName=dbName 
             self.db=self.client[self.dbName]
@@ -46,7 +81,18 @@ class dbHandler(object):
                 self.collectionName=collectionName
             self.collection=self.db[self.collectionName]
             if(id is not None):
-                self.collection.create_index(id,unique=True)
+                specs = list(INDEX_SPECS.get(self.collectionName,[]))
+                if(not any(spec['keys']==[(id,1)] for spec in specs)):
+                    specs.append({'keys':[(id,1)],'unique':True})
+                ensureIndexes(self.collection,specs=specs)
+            if(self.seen is True):
+                self.seen=seenFilter.getFilter('{}.{}'.format(self.dbName,self.collectionName))
+            if(self.queue is True):
+                self.queue=workQueue.getQueue(self.db)
+            if(self.useRollups):
+                self.rollups=RollupManager(self.db,self.collectionName,logging=self.logger)
+                if(not self.rollups.seeded() and self.collection.estimated_document_count()==0): #every match will go through the rollups
+                    self.rollups.markSeeded(0)
             print('connection established')
             if(self.logger):
                 self.logger.info('DB connection established: db={} col={}'.format(self.collectionName,self.dbName))
@@ -56,36 +102,135 @@ class dbHandler(object):
             print('Timeout Error: {}'.format(time_err))
         except errors.PyMongoError as err:
             print('Error: {}'.format(err))
+    @timed
+    @invalidates
     @retry(
         stop=stop_after_attempt(3), #retry limit
         wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError))
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
     )
-    def insertData(self,data,many):
+    def insertData(self,data,many,ordered=True):
         '''add single data entry to collection
         params-- 
         data: json 
         many: bool: multiple or single entry
-        
-        potentially added success/fail return for later application
+        ordered: bool: for many, False keeps inserting past a failed (e.g. duplicate) entry
+        returns---
+        int: number of entries inserted or None if the insert failed
         ''' 
         if self.collection is not None:
             try:
                 if(many):
-                    res = self.collection.insert_many(data)
-                    print('{} entries inserted'.format(res.inserted_ids))
+                    res = self.collection.insert_many(data,ordered=ordered)
+                    print('{} entries inserted'.format(len(res.inserted_ids)))
+                    metrics.DB_DOCUMENTS.inc(len(res.inserted_ids),method='insertData',result='inserted')
+                    if(self.rollups):
+                        self.rollups.applyBatch(data)
+                    return len(res.inserted_ids)
                 else:
                     res = self.collection.insert_one(data)
                     print('data inserted')
+                    metrics.DB_DOCUMENTS.inc(method='insertData',result='inserted')
+                    if(self.rollups):
+                        self.rollups.applyBatch([data])
+                    return 1
+            except errors.BulkWriteError as bwe:
+                print('{} entries inserted, {} failed'.format(bwe.details.get('nInserted',0),len(bwe.details.get('writeErrors',[]))))
+                metrics.DB_DOCUMENTS.inc(bwe.details.get('nInserted',0),method='insertData',result='inserted')
+                metrics.DB_DOCUMENTS.inc(len(bwe.details.get('writeErrors',[])),method='insertData',result='failed')
+                if(self.rollups):
+                    failed = {err['index'] for err in bwe.details.get('writeErrors',[])}
+                    if(ordered): #ordered inserts stop at the first failure
+                        failed = set(range(min(failed),len(data))) if failed else set()
+                    self.rollups.applyBatch([doc for i,doc in enumerate(data) if i not in failed])
+                return bwe.details.get('nInserted',0)
             except errors.PyMongoError as err:
                 print('error occured while inserting data: {}'.format(err))
         else:
             print('Collection not found')
+        return None
 
+    @timed
+    @invalidates
     @retry(
         stop=stop_after_attempt(3), #retry limit
         wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError))
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
+    )
+    def ingestData(self,data,key='match_id',upsert=False):
+        '''duplicate tolerant insert of a batch keyed by a unique field
+        ids already in self.seen are dropped before the write, the rest go in one unordered insert_many
+        (or upserts) so a duplicate never stops the documents after it
+        params--
+        data: list of json (dict)
+        key: str: unique field identifying a document
+        upsert: bool: $setOnInsert upserts instead of inserts: no duplicate key errors but every document is matched server side
+        returns---
+        dict: {'received','filtered','new','duplicates','errors','newIds'} or None if the write failed
+            filtered: skipped by the seen filter, duplicates: rejected/matched by the server
+        '''
+        if self.collection is None:
+            print('Collection not found')
+            return None
+        stats={'received':len(data),'filtered':0,'new':0,'duplicates':0,'errors':0,'newIds':[]}
+        batch=data
+        if(self.seen is not None):
+            batch=[doc for doc in data if doc.get(key) is None or doc[key] not in self.seen]
+            stats['filtered']=len(data)-len(batch)
+        if(not batch):
+            return stats
+        failed=set() #not inserted: duplicates + errors
+        errored=set()
+        try:
+            if(upsert):
+                res = self.collection.bulk_write([UpdateOne({key:doc[key]},{'$setOnInsert':doc},upsert=True) for doc in batch],ordered=False)
+                inserted=set(res.upserted_ids)
+                failed={i for i in range(len(batch)) if i not in inserted}
+                stats['duplicates']=len(failed)
+            else:
+                self.collection.insert_many(batch,ordered=False)
+        except errors.BulkWriteError as bwe: #unordered so every other document is still written
+            for err in bwe.details.get('writeErrors',[]):
+                failed.add(err['index'])
+                if(err.get('code')!=11000):
+                    errored.add(err['index'])
+            if(upsert): #upserted documents are reported in details rather than res
+                inserted={up['index'] for up in bwe.details.get('upserted',[])}
+                failed|={i for i in range(len(batch)) if i not in inserted}
+            stats['errors']=len(errored)
+            stats['duplicates']=len(failed)-len(errored)
+        except (errors.ConnectionFailure, errors.ServerSelectionTimeoutError):
+            raise
+        except errors.PyMongoError as err:
+            print('error occured while ingesting data: {}'.format(err))
+            return None
+        newDocs=[doc for i,doc in enumerate(batch) if i not in failed]
+        stats['new']=len(newDocs)
+        stats['newIds']=[doc.get(key) for doc in newDocs]
+        if(self.seen is not None): #duplicates are known to be stored too
+            self.seen.update(doc[key] for i,doc in enumerate(batch) if doc.get(key) is not None and i not in errored)
+        if(self.rollups and newDocs):
+            self.rollups.applyBatch(newDocs)
+        if(self.queue is not None and newDocs):
+            try:
+                self.queue.enqueue(newDocs,key=key)
+            except errors.PyMongoError as err: #matches are stored: scheduler --seedQueue picks them up later
+                print('error occured while queueing new entries: {}'.format(err))
+        print('{} new, {} duplicates, {} filtered, {} errors'.format(stats['new'],stats['duplicates'],stats['filtered'],stats['errors']))
+        if(metrics.enabled()):
+            for result in ('new','duplicates','filtered','errors'):
+                metrics.DB_DOCUMENTS.inc(stats[result],method='ingestData',result=result)
+        return stats
+
+    @timed
+    @invalidates
+    @retry(
+        stop=stop_after_attempt(3), #retry limit
+        wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
     )
     def updateData(self,data,many,query):
         '''add single data entry to collection
@@ -102,8 +247,10 @@ class dbHandler(object):
                 if(many):
                     res = self.collection.update_many(query, op)
                     print('{} entries updated'.format(res.modified_count))
+                    metrics.DB_DOCUMENTS.inc(res.modified_count,method='updateData',result='modified')
                 else:
                     res = self.collection.update_one(query,op)
+                    metrics.DB_DOCUMENTS.inc(res.modified_count,method='updateData',result='modified')
                     if(self.logger):        #printing for each would slow down the application too much if used in a loop
                         self.logger.info('1 entry updated' if res.modified_count>0 else 'No entries matched')
             except errors.PyMongoError as err:
@@ -111,10 +258,69 @@ class dbHandler(object):
         else:
             print('Collection not found')
 
+    def bufferUpdate(self,data,query):
+        '''queue a $set update to be sent with the next bulk write instead of its own round trip
+        params--
+        data: json (dict)
+        query: (dict) query to match to update against
+        returns---
+        batch stats (see flushUpdates) if this call triggered a flush else None
+        '''
+        self.__bulkOps.append(UpdateOne(query,{"$set":data}))
+        if(len(self.__bulkOps)>=self.bulkSize or time.monotonic()-self.__lastFlush>=self.bulkInterval):
+            return self.flushUpdates()
+        return None
+
+    @timed
+    @invalidates
+    @retry(
+        stop=stop_after_attempt(3), #retry limit
+        wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
+    )
+    def flushUpdates(self):
+        '''send all buffered updates as one unordered bulk write
+        returns---
+        dict: {'batch','matched','modified','errors'} or None if nothing was buffered
+        '''
+        self.__lastFlush=time.monotonic()
+        if(not self.__bulkOps):
+            return None
+        if self.collection is None:
+            print('Collection not found')
+            return None
+        ops=list(self.__bulkOps)
+        stats={'batch':len(ops),'matched':0,'modified':0,'errors':0}
+        try:
+            res = self.collection.bulk_write(ops,ordered=False)
+            stats['matched']=res.matched_count
+            stats['modified']=res.modified_count
+        except errors.BulkWriteError as bwe: #unordered so the rest of the batch is still applied
+            stats['matched']=bwe.details.get('nMatched',0)
+            stats['modified']=bwe.details.get('nModified',0)
+            stats['errors']=len(bwe.details.get('writeErrors',[]))
+            print('{} errors occured during bulk update'.format(stats['errors']))
+        except (errors.ConnectionFailure, errors.ServerSelectionTimeoutError):
+            raise #keep buffer and let retry resend it
+        except errors.PyMongoError as err:
+            stats['errors']=len(ops)
+            print('error occured while bulk updating data: {}'.format(err))
+        del self.__bulkOps[:len(ops)]
+        if(metrics.enabled()):
+            for result in ('matched','modified','errors'):
+                metrics.DB_DOCUMENTS.inc(stats[result],method='flushUpdates',result=result)
+        if(self.logger):
+            self.logger.info('Bulk update flushed: {}'.format(stats))
+        return stats
+
+    @timed
+    @invalidates
     @retry(
         stop=stop_after_attempt(3), #retry limit
         wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError))
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
     )        
     def deleteData(self,query,many):
         '''runs query to delete data from connected db
@@ -127,18 +333,22 @@ class dbHandler(object):
                 if(many):
                     res= self.collection.delete_many(query)
                     print('deleted {} entries'.format(res.deleted_count))
+                    metrics.DB_DOCUMENTS.inc(res.deleted_count,method='deleteData',result='deleted')
                 else:
                     res = self.collection.delete_one(query)
+                    metrics.DB_DOCUMENTS.inc(res.deleted_count,method='deleteData',result='deleted')
                     print('deleted 1 entry')
             except errors.PyMongoError as err:
                 print('Error occured: {}'.format(err))
         else:
             print('connect to db first')
 
+    @timed
     @retry(
         stop=stop_after_attempt(3), #retry limit
         wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError))
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
     )
     def searchData(self, query=None, filt=None,sort=None):
         ''' runs a query using pymongo find method
@@ -158,10 +368,12 @@ class dbHandler(object):
         else:
             print('Error: connect to db first')
     
+    @timed
     @retry(
         stop=stop_after_attempt(3), #retry limit
         wait=wait_exponential(multiplier=1,min=4,max=10), #delay before retries
-        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError))
+        retry = retry_if_exception_type((errors.ConnectionFailure, errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry #count retries per method
     )   
     def findOne(self,query=None, filt=None, sort=None):
         '''runs query using pymongo findOne
@@ -179,6 +391,7 @@ class dbHandler(object):
         else:
             print('Error: connect to db first')
 
+    @timed
     def findAll(self, query=None,filt=None,sort=None):
         '''runs query using pymongo find'''
         if self.collection is not None:
@@ -188,26 +401,147 @@ class dbHandler(object):
                 print("Error occured: {}".format(err))
         else:
             print("Error: connect to collection first")
+    def checkIndexes(self):
+        '''create declared indexes of connected collection if needed and report drift + query plans
+        returns---
+        dict: {'drift': see indexSpecs.indexDrift, 'plans': see indexSpecs.checkPlans}
+        '''
+        if self.collection is not None:
+            try:
+                ensureIndexes(self.collection,force=True)
+                drift = indexDrift(self.collection)
+                plans = [plan for plan in checkPlans(self.db) if plan['collection']==self.collectionName]
+                for plan in plans:
+                    if(plan['collscan']):
+                        print('COLLSCAN: {} on {}'.format(plan['method'],plan['collection']))
+                return {'drift':drift,'plans':plans}
+            except errors.PyMongoError as err:
+                print('Error occured: {}'.format(err))
+        else:
+            print('Error: connect to collection first')
+
+    def cacheStats(self):
+        '''hit/miss statistics of the query cache: dict or None if caching is off'''
+        return self.cache.stats() if self.cache is not None else None
+
     def endSession(self):
-        '''close connection to mongodb service'''
+        '''flush buffered updates and close connection to mongodb service
+        a shared client is left open for the next job'''
+        if self.__bulkOps:
+            self.flushUpdates()
+        if self.shared:
+            return
         if self.client:
             self.client.close()
             print('session ended')
 
+    def __timeRange(self,start=None,end=None):
+        '''start_time filter for a [start, end) range: empty dict if unbounded'''
+        bounds={}
+        if(start is not None):
+            bounds['$gte']=start
+        if(end is not None):
+            bounds['$lt']=end
+        return {'start_time':bounds} if bounds else {}
+
+    @timed
+    @invalidates
+    def migrateStartTimes(self,batchSize=1000,checkpoint=None):
+        '''convert legacy local time string start_time values to native utc dates in place
+        strings were written with the crawling machine's local time so this should run with the same timezone
+        resumable: converted documents no longer match and progress (last _id) is saved to checkpoint after each batch
+        strings not in LEGACY_TIME_FORMAT are left as they are and counted as skipped
+        params---
+        batchSize: int: documents converted per bulk write
+        checkpoint: checkpoint.Checkpoint: optional progress file
+        returns---
+        dict: {'converted','skipped'}: skipped counts every unparseable start time seen, including earlier runs of the checkpoint
+        '''
+        if self.collection is None:
+            print('Connect to db first')
+            return {'converted':0,'skipped':0}
+        state = checkpoint.load({}) if checkpoint else {}
+        skipped = state.get('skipped',0)
+        if(isinstance(state.get('lastId'),str) and ObjectId.is_valid(state['lastId'])):
+            state['lastId']=ObjectId(state['lastId'])
+        converted = 0
+        while True:
+            query = {'start_time':{'$type':'string'}}
+            if(state.get('lastId') is not None):
+                query['_id']={'$gt':state['lastId']}
+            try:
+                batch = list(self.collection.find(query,{'start_time':1}).sort('_id',1).limit(batchSize))
+                if(not batch):
+                    break
+                ops = []
+                for doc in batch:
+                    try:
+                        startTime = datetime.strptime(doc['start_time'],LEGACY_TIME_FORMAT).astimezone(timezone.utc)
+                    except ValueError:
+                        skipped += 1
+                        print('Skipping unparseable start_time {!r} of {}'.format(doc['start_time'],doc['_id']))
+                        continue
+                    ops.append(UpdateOne({'_id':doc['_id'],'start_time':doc['start_time']},{'$set':{'start_time':startTime}}))
+                if(ops):
+                    converted += self.collection.bulk_write(ops,ordered=False).modified_count
+            except errors.PyMongoError as err:
+                print('Error occured migrating start times: {}'.format(err))
+                break
+            state['lastId'] = batch[-1]['_id']
+            if(checkpoint):
+                checkpoint.save({'lastId':str(state['lastId']) if isinstance(state['lastId'],ObjectId) else state['lastId'],'skipped':skipped})
+            if(self.logger):
+                self.logger.info('Converted {} start times'.format(converted))
+        print('{} start times converted, {} skipped'.format(converted,skipped))
+        return {'converted':converted,'skipped':skipped}
+
+    def __getRollups(self):
+        '''rollup manager of connected collection, created on demand if rollups were not enabled'''
+        if(self.rollups is None):
+            self.rollups=RollupManager(self.db,self.collectionName,logging=self.logger)
+        return self.rollups
+
+    @timed
+    @invalidates
+    def rebuildRollups(self,batchSize=5000):
+        '''recompute per day/per hero rollups from scratch for the connected collection
+        params---
+        batchSize: int: matches summed per rollup write
+        returns---
+        int: number of matches processed
+        '''
+        if(self.collection is not None):
+            try:
+                return self.__getRollups().rebuild(self.collection,batchSize=batchSize)
+            except errors.PyMongoError as err:
+                print('Error occured rebuilding rollups: {}'.format(err))
+        else:
+            print('Connect to db first')
+
+    @timed
+    @cached()
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1,min=4,max=10),
-        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError))
+        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry
     )
-    def getHeroWinRateOverTime(self,interval='day', heroId=1):
+    def getHeroWinRateOverTime(self,interval='day', heroId=1, useRollups=None, start=None, end=None):
         '''aggregates win rate of specific hero over time period
         params--
         interval: str: day/week/other=monthly
         hero: int: id of hero
+        useRollups: bool: read pre-aggregated rollups instead of scanning matches: default True if rollups enabled and seeded (see rebuildRollups)
+        start: datetime: only include matches starting at or after (utc)
+        end: datetime: only include matches starting before (utc)
         returns res:list
         ''' 
         if(self.collection is not None):
             try:
+                if(useRollups is None):
+                    useRollups = self.rollups is not None and self.rollups.seeded() #partial rollups would undercount: scan until rebuildRollups ran
+                if(useRollups):
+                    return self.__getRollups().heroWinRateOverTime(heroId=heroId,interval=interval,start=start,end=end)
                 if(interval=='day'):
                     dateFormat= '%Y-%m-%d'
                 elif(interval=='week'):
@@ -216,7 +550,7 @@ class dbHandler(object):
                     dateFormat='%Y-%m'
                 if(self.logger):
                     self.logger.info('date format selected {}'.format(dateFormat))                               
-                aggrQuery=[#
+                aggrQuery=[#start_time is a native date so it is grouped on directly
                     {
                         '$match': {
                             '$or': [
@@ -225,13 +559,11 @@ class dbHandler(object):
                                 }, {
                                     'dire_team': heroId
                                 }
-                            ]
+                            ],
+                            **self.__timeRange(start,end)
                         }
                     }, {
                         '$addFields': {
-                            'numeric_start_time': {
-                                '$toDate': '$start_time'
-                            }, 
                             'numeric_radiant_win': {
                                 '$cond': {
                                     'if': {
@@ -282,7 +614,7 @@ class dbHandler(object):
                             '_id': {
                                 '$dateToString': {
                                     'format': dateFormat, 
-                                    'date': '$numeric_start_time'
+                                    'date': '$start_time'
                                 }
                             }, 
                             'total_matches': {
@@ -368,19 +700,106 @@ class dbHandler(object):
             except errors.PyMongoError as err:
                 print('Error occured {}'.format(err))
    
+    @timed
+    @cached()
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1,min=4,max=10),
+        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry
+    )
+    def getAllHeroesWinRateOverTime(self,interval='day',heroIds=None,useRollups=None,start=None,end=None):
+        '''aggregates win rate over time for every hero (or a subset) in a single pass over the collection
+        each match's teams are unwound once and grouped by (hero, period) instead of one scan per hero
+        params--
+        interval: str: day/week/other=monthly
+        heroIds: list of int: heroes to include: default all
+        useRollups: bool: read pre-aggregated rollups instead of scanning matches: default True if rollups enabled and seeded (see rebuildRollups)
+        start: datetime: only include matches starting at or after (utc)
+        end: datetime: only include matches starting before (utc)
+        returns---
+        dict: {heroId: list} each list in the same shape as getHeroWinRateOverTime
+        '''
+        if(self.collection is not None):
+            try:
+                if(useRollups is None):
+                    useRollups = self.rollups is not None and self.rollups.seeded() #partial rollups would undercount: scan until rebuildRollups ran
+                if(useRollups):
+                    return self.__getRollups().allHeroesWinRateOverTime(heroIds=heroIds,interval=interval,start=start,end=end)
+                if(interval=='day'):
+                    dateFormat= '%Y-%m-%d'
+                elif(interval=='week'):
+                    dateFormat='%Y-%U'
+                else:
+                    dateFormat='%Y-%m'
+                if(self.logger):
+                    self.logger.info('date format selected {}'.format(dateFormat))
+                aggrQuery=[]
+                match=self.__timeRange(start,end)
+                if(heroIds is not None):
+                    match['$or']=[{'radiant_team':{'$in':heroIds}},{'dire_team':{'$in':heroIds}}]
+                if(match):
+                    aggrQuery.append({'$match':match})
+                aggrQuery+=[#tag each hero with its side => unwind => group by hero+period
+                    {
+                        '$project':{
+                            '_id':0,
+                            'date':{'$dateToString':{'format':dateFormat,'date':'$start_time'}},
+                            'radiant_win':1,
+                            'heroes':{'$concatArrays':[
+                                {'$map':{'input':{'$ifNull':['$radiant_team',[]]},'as':'hero','in':{'hero':'$$hero','radiant':True}}},
+                                {'$map':{'input':{'$ifNull':['$dire_team',[]]},'as':'hero','in':{'hero':'$$hero','radiant':False}}}
+                            ]}
+                        }
+                    },
+                    {'$unwind':'$heroes'}
+                ]
+                if(heroIds is not None):
+                    aggrQuery.append({'$match':{'heroes.hero':{'$in':heroIds}}})
+                aggrQuery+=[
+                    {
+                        '$group':{
+                            '_id':{'hero':'$heroes.hero','date':'$date'},
+                            'radiant_won':{'$sum':{'$cond':[{'$and':['$heroes.radiant','$radiant_win']},1,0]}},
+                            'dire_won':{'$sum':{'$cond':[{'$and':[{'$not':['$heroes.radiant']},{'$eq':['$radiant_win',False]}]},1,0]}},
+                            'total_radiant_matches':{'$sum':{'$cond':['$heroes.radiant',1,0]}},
+                            'total_dire_matches':{'$sum':{'$cond':['$heroes.radiant',0,1]}}
+                        }
+                    },
+                    {'$sort':SON([('_id.hero',1),('_id.date',1)])}
+                ]
+                res={}
+                for doc in self.collection.aggregate(aggrQuery,allowDiskUse=True):
+                    res.setdefault(doc['_id']['hero'],[]).append(RollupManager.heroRow(doc['_id']['date'],doc))
+                return res
+            except errors.PyMongoError as err:
+                print('Error occured {}'.format(err))
+        else:
+            print("Connect to db first")
+
+    @timed
+    @cached()
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1,min=4,max=10),
-        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError))
+        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry
     )
-    def getWinRateOverTime(self, interval='day'):
+    def getWinRateOverTime(self, interval='day', useRollups=None, start=None, end=None):
         ''' aggregates data by time and calculates win rate
         params--- 
         interval: str: day/week/other=monthly
+        useRollups: bool: read pre-aggregated rollups instead of scanning matches: default True if rollups enabled and seeded (see rebuildRollups)
+        start: datetime: only include matches starting at or after (utc): range scan on start_time index
+        end: datetime: only include matches starting before (utc)
         return: res: list
         '''
         if(self.collection is not None):
             try:
+                if(useRollups is None):
+                    useRollups = self.rollups is not None and self.rollups.seeded() #partial rollups would undercount: scan until rebuildRollups ran
+                if(useRollups):
+                    return self.__getRollups().winRateOverTime(interval=interval,start=start,end=end)
                 if(interval=='day'):
                     dateFormat= '%Y-%m-%d'
                 elif(interval=='week'):
@@ -390,17 +809,19 @@ class dbHandler(object):
                 if(self.logger):
                     self.logger.info('date format selected {}'.format(dateFormat))
                 
-                aggrQuery=[#convert date from str to date format => order by date => calc total matches=> calc percent winrate =>sort by date
+                aggrQuery=[#filter time range => group by date => calc total matches=> calc percent winrate =>sort by date
+                    {
+                        "$match":self.__timeRange(start,end)
+                    },
                     {
                         "$addFields":{
-                            "numeric_start_time":{"$toDate":"$start_time"},
                             "numeric_radiant_win":{"$cond":{"if":"$radiant_win","then":1,"else":0}}
                         }
                     },
                     {
                         "$group":{ 
                             "_id":{
-                                "$dateToString": {"format": dateFormat,"date":"$numeric_start_time"}
+                                "$dateToString": {"format": dateFormat,"date":"$start_time"}
                             },
                             "total_matches":{"$sum":1}, 
                             "radiant_won":{"$sum":"$numeric_radiant_win"}
@@ -424,10 +845,13 @@ class dbHandler(object):
         else:
             print("Connect to db first")
 
+    @timed
+    @cached()
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1,min=4,max=10),
-        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError))
+        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry
     )
     def getAggregate(self,query):
         '''run general aggregate queries
@@ -444,10 +868,13 @@ class dbHandler(object):
         else:
             print("Connect to db first")
 
+    @timed
+    @cached(ttl=60)
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1,min=4,max=10),
-        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError))
+        retry= retry_if_exception_type((errors.ConnectionFailure,errors.ServerSelectionTimeoutError)),
+        before_sleep=metrics.countRetry
     )
     def countEntries(self,query={}):
         '''return count documents on query
@@ -0,0 +1,167 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+MAX_MATCHES_PER_REQUEST=100 #GetMatchHistoryBySequenceNum cap
+
+def planWindows(seqNums,windowSize=MAX_MATCHES_PER_REQUEST):
+    '''group pending sequence numbers into windows that can each be served by one request
+    sequence numbers are global + contiguous so a window starting at s with size n returns matches s..s+n-1
+    params---
+    seqNums: iterable of int
+    windowSize: int: max span of a window (<=100)
+    returns---
+    list of lists of sorted sequence numbers
+    '''
+    windows=[]
+    for seqNum in sorted(set(seqNums)):
+        if(windows and seqNum-windows[-1][0]<windowSize):
+            windows[-1].append(seqNum)
+        else:
+            windows.append([seqNum])
+    return windows
+
+class DetailFetcher(object):
+    def __init__(self,api,maxWorkers=8,hostLimits=None,defaultHostLimit=4,window=None,windowSize=MAX_MATCHES_PER_REQUEST,planSize=5000,logging=None):
+        '''fetch match details concurrently through a shared ApiHandler
+        params---
+            api: ApiHandler instance used to build + send requests
+            maxWorkers: int: size of the thread pool
+            hostLimits: dict: {host: max in-flight requests} for specific upstream hosts
+            defaultHostLimit: int: max in-flight requests for any host not in hostLimits
+            window: int: max number of submitted but not yet yielded requests: default 2*maxWorkers
+            windowSize: int: max sequence span fetched by one request: 1 = one request per match
+            planSize: int: how many pending sequence numbers are read ahead and planned together
+            logging: enable logs
+        '''
+        self.api=api
+        self.maxWorkers=maxWorkers
+        self.hostLimits=hostLimits or {}
+        self.defaultHostLimit=defaultHostLimit
+        self.window=window or maxWorkers*2
+        self.windowSize=min(windowSize,MAX_MATCHES_PER_REQUEST)
+        self.planSize=planSize
+        self.stats={'matches':0,'requests':0,'fallbacks':0,'missing':0}
+        self.__hostSemaphores={}
+        self.__lock=threading.Lock()
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def __hostSemaphore(self,url):
+        '''return (creating if needed) the semaphore limiting requests to the host of url'''
+        host = urlparse(url).netloc
+        with self.__lock:
+            if(host not in self.__hostSemaphores):
+                self.__hostSemaphores[host]=threading.BoundedSemaphore(self.hostLimits.get(host,self.defaultHostLimit))
+            return self.__hostSemaphores[host]
+
+    def send(self,url):
+        '''send request through api while respecting the per host limit
+        params---
+        url: str
+        returns---
+        json data
+        '''
+        with self.__lock:
+            self.stats['requests']+=1
+        with self.__hostSemaphore(url):
+            return self.api.sendRequest(url)
+
+    def fetchOne(self,matchSeqNum):
+        '''fetch details of a single match using the sequence number endpoint
+        params---
+        matchSeqNum: int
+        returns---
+        match details: dict or None on failure
+        '''
+        try:
+            url = self.api.fetchMatchHistoryBySeqNum(**{"start_at_match_seq_num":matchSeqNum, "matches_requested":1})
+            data = self.send(url)
+            return data['result']['matches'][0]
+        except (KeyError,IndexError,TypeError) as err:
+            print("Error fetching details for seq num {}: {}".format(matchSeqNum,err))
+        except Exception as e:
+            print("Error occured fetching details {}".format(e))
+        return None
+
+    def fetchWindow(self,window):
+        '''fetch a window of sequence numbers with a single request and fan results back out
+        any match missing from the response is retried on its own
+        params---
+        window: list of int: sorted sequence numbers from planWindows
+        returns---
+        list of (matchSeqNum, details or None) in window order
+        '''
+        found={}
+        if(len(window)>1):
+            try:
+                url = self.api.fetchMatchHistoryBySeqNum(**{"start_at_match_seq_num":window[0], "matches_requested":window[-1]-window[0]+1})
+                data = self.send(url)
+                found={match['match_seq_num']:match for match in data['result']['matches']}
+            except (KeyError,TypeError) as err:
+                print("Error fetching window starting at {}: {}".format(window[0],err))
+            except Exception as e:
+                print("Error occured fetching window {}".format(e))
+        results=[]
+        for seqNum in window:
+            if(seqNum in found):
+                detail=found[seqNum]
+            else:
+                if(len(window)>1):
+                    with self.__lock:
+                        self.stats['fallbacks']+=1
+                detail=self.fetchOne(seqNum)
+            if(detail is None):
+                with self.__lock:
+                    self.stats['missing']+=1
+            results.append((seqNum,detail))
+        with self.__lock:
+            self.stats['matches']+=len(window)
+        return results
+
+    def callsSaved(self):
+        '''number of requests avoided compared with fetching one match per request'''
+        return self.stats['matches']-self.stats['requests']
+
+    def report(self):
+        '''summary of the last fetch: str'''
+        return "Fetched {} matches with {} requests ({} saved, {} fallbacks, {} missing)".format(
+            self.stats['matches'],self.stats['requests'],self.callsSaved(),self.stats['fallbacks'],self.stats['missing'])
+
+    def __chunks(self,iterable):
+        '''split a (lazy) iterable into lists of planSize'''
+        chunk=[]
+        for item in iterable:
+            chunk.append(item)
+            if(len(chunk)>=self.planSize):
+                yield chunk
+                chunk=[]
+        if chunk:
+            yield chunk
+
+    def fetchAll(self,matchSeqNums):
+        '''fetch details for every sequence number concurrently
+        sequence numbers are read ahead in chunks of planSize and grouped into windows (see planWindows)
+        results are yielded in plan order (sorted within each chunk) regardless of completion order
+        params---
+        matchSeqNums: iterable of int: can be a lazy generator (e.g. wrapping a db cursor)
+        returns---
+        generator of (matchSeqNum, details or None)
+        '''
+        self.stats={'matches':0,'requests':0,'fallbacks':0,'missing':0}
+        pending=deque()
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            for chunk in self.__chunks(matchSeqNums):
+                for window in planWindows(chunk,self.windowSize):
+                    pending.append(pool.submit(self.fetchWindow,window))
+                    if(len(pending)>=self.window): #only keep a bounded number in flight
+                        yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        if(self.logger):
+            self.logger.info(self.report())
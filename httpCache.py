@@ -0,0 +1,123 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+class HttpCache(object):
+    def __init__(self,directory='.http_cache',maxAge=3600):
+        '''on disk cache of response bodies + validators (ETag/Last-Modified) for conditional requests
+        a parsed copy of each body is also kept in memory so repeated lookups within maxAge skip the network
+        callers always get their own deep copy: mutating a returned payload never changes later cache hits
+        params---
+            directory: str: where bodies are stored, created on first write
+            maxAge: float: seconds a cached body is served without revalidating
+        '''
+        self.directory=directory
+        self.maxAge=maxAge
+        self.__memory={} #key -> (checked at, parsed body)
+        self.__lock=threading.Lock()
+
+    def __key(self,url):
+        '''file name for url: hashed so api keys in query strings are not written to disk'''
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def __paths(self,key):
+        return os.path.join(self.directory,key+'.json'),os.path.join(self.directory,key+'.body')
+
+    def __write(self,path,data):
+        '''atomic write: temp file then rename'''
+        fd,tmpPath=tempfile.mkstemp(dir=self.directory,prefix='.tmp_')
+        with os.fdopen(fd,'wb') as f:
+            f.write(data)
+        os.replace(tmpPath,path)
+
+    @staticmethod
+    def parse(body,contentType):
+        '''same decoding as ApiHandler.sendRequest: json if the server says so else text'''
+        if('application/json' in (contentType or '')):
+            return json.loads(body)
+        return body.decode('utf-8')
+
+    def fresh(self,url):
+        '''parsed body if it was fetched or revalidated less than maxAge ago else None'''
+        with self.__lock:
+            entry=self.__memory.get(self.__key(url))
+        if(entry and time.time()-entry[0]<self.maxAge):
+            return copy.deepcopy(entry[1])
+        return None
+
+    def lookup(self,url):
+        '''stored entry for url
+        returns---
+        dict: {'etag','lastModified','contentType','parsed'} or None if not cached
+        '''
+        key=self.__key(url)
+        metaPath,bodyPath=self.__paths(key)
+        try:
+            with open(metaPath,'r') as f:
+                meta=json.load(f)
+            with self.__lock:
+                entry=self.__memory.get(key)
+            if(entry is None):
+                with open(bodyPath,'rb') as f:
+                    parsed=self.parse(f.read(),meta.get('contentType'))
+                with self.__lock:
+                    self.__memory[key]=(meta.get('checked',0),parsed)
+            else:
+                parsed=entry[1]
+        except (FileNotFoundError,ValueError):
+            return None
+        meta['parsed']=copy.deepcopy(parsed)
+        return meta
+
+    @staticmethod
+    def conditionalHeaders(entry):
+        '''If-None-Match/If-Modified-Since headers revalidating a stored entry'''
+        headers={}
+        if(entry):
+            if(entry.get('etag')):
+                headers['If-None-Match']=entry['etag']
+            if(entry.get('lastModified')):
+                headers['If-Modified-Since']=entry['lastModified']
+        return headers
+
+    def store(self,url,response):
+        '''save a 200 response body with its validators
+        returns---
+        parsed body
+        '''
+        key=self.__key(url)
+        metaPath,bodyPath=self.__paths(key)
+        contentType=response.headers.get('Content-Type','')
+        parsed=self.parse(response.content,contentType)
+        meta={'etag':response.headers.get('ETag'),'lastModified':response.headers.get('Last-Modified'),
+              'contentType':contentType,'checked':time.time()}
+        try:
+            os.makedirs(self.directory,exist_ok=True)
+            self.__write(bodyPath,response.content)
+            self.__write(metaPath,json.dumps(meta).encode('utf-8'))
+        except OSError as err:
+            print('Could not write http cache: {}'.format(err))
+        with self.__lock:
+            self.__memory[key]=(meta['checked'],parsed)
+        return copy.deepcopy(parsed)
+
+    def touch(self,url):
+        '''mark a stored entry as revalidated (304) so it is served from memory for another maxAge'''
+        entry=self.lookup(url)
+        if(entry is None):
+            return None
+        key=self.__key(url)
+        metaPath,_=self.__paths(key)
+        parsed=entry.pop('parsed')
+        entry['checked']=time.time()
+        try:
+            self.__write(metaPath,json.dumps(entry).encode('utf-8'))
+        except OSError as err:
+            print('Could not write http cache: {}'.format(err))
+        with self.__lock:
+            self.__memory[key]=(entry['checked'],parsed)
+        return parsed
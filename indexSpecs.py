@@ -0,0 +1,139 @@
+from datetime import datetime, timezone
+from pymongo import IndexModel, ASCENDING, DESCENDING, errors
+
+#declared indexes per collection: keys + IndexModel options
+INDEX_SPECS={
+    'matches':[
+        {'keys':[('match_id',ASCENDING)],'unique':True},
+        {'keys':[('detailed',ASCENDING),('match_seq_num',ASCENDING)]}, #pending detail lookups sorted by seq num
+        {'keys':[('match_seq_num',ASCENDING)],'partialFilterExpression':{'match_seq_num':{'$exists':True}}}, #detail merges by seq num
+        {'keys':[('radiant_team',ASCENDING)]}, #multikey: hero win rates
+        {'keys':[('dire_team',ASCENDING)]}, #multikey: hero win rates
+        {'keys':[('start_time',ASCENDING)]}, #time bucketed queries
+    ],
+    'matches_steam':[
+        {'keys':[('match_id',ASCENDING)],'unique':True},
+        {'keys':[('match_seq_num',DESCENDING)]}, #latest sequence number
+        {'keys':[('start_time',ASCENDING)]},
+    ],
+    'matches_rollup_hero_daily':[
+        {'keys':[('hero',ASCENDING),('day',ASCENDING)]}, #rollup reads of a hero over a day range
+    ],
+    'match_queue':[
+        {'keys':[('state',ASCENDING),('seq',ASCENDING)]}, #claims: pending in seq num order
+        {'keys':[('state',ASCENDING),('leaseUntil',ASCENDING)]}, #expired leases
+        {'keys':[('token',ASCENDING)],'sparse':True}, #matches of a lease
+        {'keys':[('doneAt',ASCENDING)],'expireAfterSeconds':7*86400}, #done matches are dropped after a week
+    ],
+}
+
+#representative query of each dbHandler query method, explained by checkPlans
+QUERY_CHECKS=[
+    {'method':'claim (mergeMatches pending)','collection':'match_queue','filter':{'state':'pending'},'sort':[('seq',ASCENDING)]},
+    {'method':'seed (undetailed matches)','collection':'matches','filter':{'detailed':{'$exists':False}},'sort':[('match_seq_num',ASCENDING)]},
+    {'method':'updateData (updateDetails)','collection':'matches','filter':{'match_seq_num':1}},
+    {'method':'findOne (getLatestSequenceNumber)','collection':'matches_steam','filter':{},'sort':[('match_seq_num',DESCENDING)]},
+    {'method':'getHeroWinRateOverTime','collection':'matches','pipeline':[{'$match':{'$or':[{'radiant_team':1},{'dire_team':1}]}}]},
+    {'method':'getAllHeroesWinRateOverTime (subset)','collection':'matches','pipeline':[{'$match':{'$or':[{'radiant_team':{'$in':[1,2]}},{'dire_team':{'$in':[1,2]}}]}}]},
+    {'method':'getWinRateOverTime (time range)','collection':'matches','pipeline':[{'$match':{'start_time':{'$gte':datetime(2024,1,1,tzinfo=timezone.utc)}}}]},
+]
+
+_ensured=set() #'db.collection' names already ensured by this process
+
+def specName(spec):
+    '''index name mongo generates for a key pattern e.g. detailed_1_match_seq_num_1'''
+    return '_'.join('{}_{}'.format(key,direction) for key,direction in spec['keys'])
+
+def ensureIndexes(collection,specs=None,force=False):
+    '''create any missing declared index of a collection, only once per process
+    params---
+    collection: pymongo collection
+    specs: list of dict: default INDEX_SPECS[collection.name]
+    force: bool: create even if already ensured by this process
+    returns---
+    bool: True if indexes were sent to the server
+    '''
+    specs=INDEX_SPECS.get(collection.name,[]) if specs is None else specs
+    key=collection.full_name
+    if((key in _ensured and not force) or not specs):
+        return False
+    existing=collection.index_information()
+    for spec in specs:
+        name=specName(spec)
+        if(name in existing): #already there: differences are reported by indexDrift rather than rebuilt here
+            continue
+        try:
+            collection.create_indexes([IndexModel(spec['keys'],name=name,**{k:v for k,v in spec.items() if k!='keys'})])
+        except errors.OperationFailure as err: #e.g. duplicates violating a unique spec
+            print('Error creating index {} on {}: {}'.format(name,collection.name,err))
+    _ensured.add(key)
+    return True
+
+def indexDrift(collection,specs=None):
+    '''compare indexes present on the server against the declared specs
+    params---
+    collection: pymongo collection
+    specs: list of dict: default INDEX_SPECS[collection.name]
+    returns---
+    dict: {'missing': [names], 'extra': [names], 'changed': [names]} (changed = same name, different keys/options)
+    '''
+    specs=INDEX_SPECS.get(collection.name,[]) if specs is None else specs
+    existing=collection.index_information()
+    existing.pop('_id_',None)
+    drift={'missing':[],'extra':[],'changed':[]}
+    declared=set()
+    for spec in specs:
+        name=specName(spec)
+        declared.add(name)
+        if(name not in existing):
+            drift['missing'].append(name)
+            continue
+        info=existing[name]
+        same=[tuple(k) for k in info['key']]==[tuple(k) for k in spec['keys']]
+        for option in ('unique','sparse'):
+            if(bool(info.get(option))!=bool(spec.get(option))):
+                same=False
+        for option in ('partialFilterExpression','expireAfterSeconds'):
+            if(info.get(option)!=spec.get(option)):
+                same=False
+        if(not same):
+            drift['changed'].append(name)
+    drift['extra']=[name for name in existing if name not in declared]
+    return drift
+
+def _stages(plan):
+    '''every stage name in an explain output'''
+    if(isinstance(plan,dict)):
+        if('stage' in plan):
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif(isinstance(plan,list)):
+        for value in plan:
+            yield from _stages(value)
+
+def checkPlans(db,checks=None):
+    '''explain the query behind each dbHandler query method and flag those that fall back to a COLLSCAN
+    params---
+    db: pymongo database
+    checks: list of dict: default QUERY_CHECKS
+    returns---
+    list of {'method','collection','stages','collscan'}
+    '''
+    report=[]
+    for check in (QUERY_CHECKS if checks is None else checks):
+        collection=db[check['collection']]
+        try:
+            if('pipeline' in check):
+                plan=db.command('explain',{'aggregate':collection.name,'pipeline':check['pipeline'],'cursor':{}},verbosity='queryPlanner')
+            else:
+                cursor=collection.find(check['filter'])
+                if(check.get('sort')):
+                    cursor=cursor.sort(check['sort'])
+                plan=cursor.explain()
+            stages=sorted(set(_stages(plan)))
+        except errors.PyMongoError as err:
+            print('Error explaining {}: {}'.format(check['method'],err))
+            continue
+        report.append({'method':check['method'],'collection':collection.name,'stages':stages,'collscan':'COLLSCAN' in stages})
+    return report
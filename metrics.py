@@ -0,0 +1,237 @@
+import time
+import bisect
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_enabled=False #every instrument is a no-op until enable()/serve(): one global check per call when disabled
+_registry=[]
+_registryLock=threading.Lock()
+
+DEFAULT_BUCKETS=(0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30)
+
+def enable():
+    global _enabled
+    _enabled=True
+
+def disable():
+    global _enabled
+    _enabled=False
+
+def enabled():
+    return _enabled
+
+def _labelKey(labelNames,labels):
+    return tuple(str(labels.get(name,'')) for name in labelNames)
+
+def _formatLabels(labelNames,key,extra=None):
+    pairs=['{}="{}"'.format(name,value.replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')) for name,value in zip(labelNames,key)]
+    if(extra):
+        pairs.append('{}="{}"'.format(*extra))
+    return '{'+','.join(pairs)+'}' if pairs else ''
+
+class Metric(object):
+    kind='untyped'
+    def __init__(self,name,help='',labelNames=()):
+        '''base of Counter/Gauge/Histogram: registered on creation and rendered by render()
+        params---
+            name: str: prometheus metric name
+            help: str: description shown in the exposition
+            labelNames: tuple of str: label names, values are passed as keyword args when recording
+        '''
+        self.name=name
+        self.help=help
+        self.labelNames=tuple(labelNames)
+        self._values={}
+        self._lock=threading.Lock()
+        with _registryLock:
+            _registry.append(self)
+
+    def samples(self):
+        '''(suffix, label key, extra label, value) tuples of the exposition'''
+        with self._lock:
+            return [('',key,None,value) for key,value in self._values.items()]
+
+    def render(self):
+        lines=['# HELP {} {}'.format(self.name,self.help),'# TYPE {} {}'.format(self.name,self.kind)]
+        for suffix,key,extra,value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name,suffix,_formatLabels(self.labelNames,key,extra),repr(float(value))))
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    kind='counter'
+    def inc(self,amount=1,**labels):
+        '''add amount (>=0)'''
+        if(not _enabled):
+            return
+        key=_labelKey(self.labelNames,labels)
+        with self._lock:
+            self._values[key]=self._values.get(key,0)+amount
+
+    def value(self,**labels):
+        return self._values.get(_labelKey(self.labelNames,labels),0)
+
+class Gauge(Metric):
+    kind='gauge'
+    def set(self,value,**labels):
+        if(not _enabled):
+            return
+        key=_labelKey(self.labelNames,labels)
+        with self._lock:
+            self._values[key]=value
+
+    def inc(self,amount=1,**labels):
+        if(not _enabled):
+            return
+        key=_labelKey(self.labelNames,labels)
+        with self._lock:
+            self._values[key]=self._values.get(key,0)+amount
+
+    def dec(self,amount=1,**labels):
+        self.inc(-amount,**labels)
+
+    def value(self,**labels):
+        return self._values.get(_labelKey(self.labelNames,labels),0)
+
+class Histogram(Metric):
+    kind='histogram'
+    def __init__(self,name,help='',labelNames=(),buckets=DEFAULT_BUCKETS):
+        '''cumulative bucket histogram: percentiles are computed from the buckets by prometheus (histogram_quantile) or quantile()
+        params---
+            buckets: tuple of float: upper bounds, +Inf is added
+        '''
+        super().__init__(name,help,labelNames)
+        self.buckets=tuple(sorted(buckets))
+
+    def observe(self,value,**labels):
+        if(not _enabled):
+            return
+        key=_labelKey(self.labelNames,labels)
+        with self._lock:
+            entry=self._values.get(key)
+            if(entry is None):
+                entry=self._values[key]=[[0]*(len(self.buckets)+1),0.0,0] #per bucket counts, sum, count
+            entry[0][bisect.bisect_left(self.buckets,value)]+=1
+            entry[1]+=value
+            entry[2]+=1
+
+    def quantile(self,q,**labels):
+        '''estimate of the q quantile (0-1) from the buckets, linear within a bucket: None if nothing observed'''
+        entry=self._values.get(_labelKey(self.labelNames,labels))
+        if(not entry or not entry[2]):
+            return None
+        rank=q*entry[2]
+        seen=0
+        for i,count in enumerate(entry[0]):
+            if(seen+count>=rank and count):
+                if(i==len(self.buckets)): #+Inf bucket: best answer is the largest bound
+                    return self.buckets[-1]
+                lower=self.buckets[i-1] if i else 0.0
+                return lower+(self.buckets[i]-lower)*(rank-seen)/count
+            seen+=count
+        return self.buckets[-1]
+
+    def samples(self):
+        samples=[]
+        with self._lock:
+            for key,(counts,total,count) in self._values.items():
+                cumulative=0
+                for bound,bucketCount in zip(self.buckets+(float('inf'),),counts):
+                    cumulative+=bucketCount
+                    samples.append(('_bucket',key,('le','+Inf' if bound==float('inf') else repr(float(bound))),cumulative))
+                samples.append(('_sum',key,None,total))
+                samples.append(('_count',key,None,count))
+        return samples
+
+class timer(object):
+    '''context manager observing elapsed seconds into a histogram'''
+    def __init__(self,histogram,**labels):
+        self.histogram=histogram
+        self.labels=labels
+    def __enter__(self):
+        self.start=time.perf_counter() if _enabled else None
+        return self
+    def __exit__(self,*exc):
+        if(self.start is not None):
+            self.histogram.observe(time.perf_counter()-self.start,**self.labels)
+        return False
+
+def instrumented(histogram,counter,rows=None,**labels):
+    '''time a function into histogram and count its calls in counter by status (ok/error)
+    params---
+    histogram: Histogram with a 'method' label (+ labels)
+    counter: Counter with 'method' and 'status' labels
+    rows: Counter with a 'method' label: adds len(result) for results that have a length e.g. parsed rows
+    labels: extra fixed labels
+    '''
+    def decorator(fn):
+        method=fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args,**kwargs):
+            if(not _enabled):
+                return fn(*args,**kwargs)
+            start=time.perf_counter()
+            status='error'
+            try:
+                result=fn(*args,**kwargs)
+                status='ok' if result is not None else 'empty'
+                if(rows is not None and hasattr(result,'__len__')):
+                    rows.inc(len(result),method=method,**labels)
+                return result
+            finally:
+                histogram.observe(time.perf_counter()-start,method=method,**labels)
+                counter.inc(method=method,status=status,**labels)
+        return wrapper
+    return decorator
+
+def countRetry(retryState):
+    '''tenacity before_sleep hook counting retries per function'''
+    RETRIES.inc(operation=getattr(retryState.fn,'__name__','unknown'))
+
+def render():
+    '''every registered metric in prometheus text exposition format'''
+    with _registryLock:
+        metrics=list(_registry)
+    return '\n'.join(metric.render() for metric in metrics)+'\n'
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if(self.path.split('?')[0] not in ('/metrics','/')):
+            self.send_error(404)
+            return
+        body=render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type','text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,format,*args): #scrapes every few seconds would flood stdout
+        pass
+
+def serve(port=9108,host='127.0.0.1'):
+    '''enable metrics and expose them at http://host:port/metrics from a daemon thread
+    returns---
+    ThreadingHTTPServer: call shutdown() to stop
+    '''
+    enable()
+    server=ThreadingHTTPServer((host,port),_Handler)
+    threading.Thread(target=server.serve_forever,name='metrics',daemon=True).start()
+    print('Metrics exposed on http://{}:{}/metrics'.format(host,port))
+    return server
+
+#instruments shared by the modules
+REQUEST_SECONDS=Histogram('dota2_request_seconds','Upstream request latency until headers received',('host','status'))
+RESPONSE_BYTES=Counter('dota2_response_bytes_total','Response body bytes downloaded',('host',))
+RETRIES=Counter('dota2_retries_total','Retries scheduled by tenacity',('operation',))
+PARSE_SECONDS=Histogram('dota2_parse_seconds','Time spent in parseData methods',('method',))
+PARSE_CALLS=Counter('dota2_parse_calls_total','parseData method calls',('method','status'))
+PARSED_ROWS=Counter('dota2_parsed_rows_total','Rows produced by parseData methods',('method',))
+DB_SECONDS=Histogram('dota2_db_seconds','Time spent in dbHandler write/query methods',('method',))
+DB_CALLS=Counter('dota2_db_calls_total','dbHandler write/query method calls',('method','status'))
+DB_DOCUMENTS=Counter('dota2_db_documents_total','Documents written by dbHandler',('method','result'))
+BACKLOG=Gauge('dota2_undetailed_backlog','Matches waiting for details')
+QUEUE_DEPTH=Gauge('dota2_pipeline_queue_depth','Items waiting in a pipeline stage input queue',('stage',))
+STAGE_ITEMS=Counter('dota2_pipeline_items_total','Items processed by a pipeline stage',('stage',))
+QUOTA_TOKENS=Gauge('dota2_quota_tokens','Tokens left in the shared rate limit bucket of a host',('host',))
+QUOTA_WAIT_SECONDS=Counter('dota2_quota_wait_seconds_total','Seconds spent waiting for rate limit tokens or Retry-After blocks',('host',))
@@ -5,10 +5,32 @@ import urls
 import json
 import os
 from time import strftime, localtime 
+from datetime import datetime, timezone
+import metrics
+
+RANKED_GAME_MODE=22
+RANKED_LOBBY_TYPES=(6,7) #6=forced solo mm 7=normal ranked lobby
+MIN_DURATION=900 #15 minutes
+TIME_FORMAT='%Y-%m-%d %H:%M:%S' #legacy local time string format of start_time, see dbHandler.migrateStartTimes
+timed=metrics.instrumented(metrics.PARSE_SECONDS,metrics.PARSE_CALLS,rows=metrics.PARSED_ROWS) #latency, calls + rows produced
+
+def chunked(iterable,size):
+    '''group a (lazy) iterable into lists of at most size items'''
+    batch=[]
+    for item in iterable:
+        batch.append(item)
+        if(len(batch)>=size):
+            yield batch
+            batch=[]
+    if batch:
+        yield batch
 
 class parseData:
 
     def __init__(self, logging=None):
+        '''params---
+            logging: enable logs
+        '''
         if(logging):
             import logging
             logging.basicConfig(level=logging.NOTSET)
@@ -16,6 +38,7 @@ class parseData:
         else:
             self.logger=None
         
+    @timed
     def parseHeroesSteam(self,jsonDump):
         '''parse hero response from Steam API
         params---
@@ -37,6 +60,7 @@ class parseData:
         return "{}{}_full.png".format(urls.BASE_HERO_IMAGES_URL,row['name'].replace('npc_dota_hero_',''))
     def __createHeroPortraitUrlSmall(self,row):
         return "https://cdn.cloudflare.steamstatic.com//apps/dota2/images/dota_react/heroes/icons/{}.png".format(row['name'].replace('npc_dota_hero_',''))
+    @timed
     def parseMatchesSteam(self,jsonDump):
         '''parse match response from SteamAPI 
         params---
@@ -45,35 +69,76 @@ class parseData:
         parsed matches:dict
     '''
         return jsonDump['result']['matches']
+
+    def iterMatchesSteam(self,chunks):
+        '''incrementally parse a SteamAPI match history response, yielding each match as soon as it is complete
+        only the current partially received match is held in memory, not the whole page
+        params---
+        chunks: iterable of str: response body pieces e.g. ApiHandler.streamRequest
+        returns---
+        generator of match:dict
+        '''
+        decoder=json.JSONDecoder()
+        chunks=iter(chunks)
+        buffer=''
+        #skip ahead to the opening bracket of the matches array
+        while True:
+            key=buffer.find('"matches"')
+            start=buffer.find('[',key) if key!=-1 else -1
+            if(start!=-1):
+                buffer=buffer[start+1:]
+                break
+            chunk=next(chunks,None)
+            if(chunk is None): #no matches in response e.g. error status
+                if(self.logger):
+                    self.logger.info('No matches found in response')
+                return
+            buffer+=chunk
+        pos=0
+        count=0
+        while True:
+            while(pos<len(buffer) and buffer[pos] in ' \t\r\n,'):
+                pos+=1
+            if(pos<len(buffer)):
+                if(buffer[pos]==']'):
+                    break
+                try:
+                    match,pos=decoder.raw_decode(buffer,pos)
+                    count+=1
+                    metrics.PARSED_ROWS.inc(method='iterMatchesSteam')
+                    yield match
+                    continue
+                except ValueError: #match not fully received yet
+                    pass
+            chunk=next(chunks,None)
+            if(chunk is None):
+                raise ValueError('Response ended before matches array was closed')
+            buffer=buffer[pos:]+chunk
+            pos=0
+        if(self.logger):
+            self.logger.info('Streamed {} matches'.format(count))
         
 
+    @timed
     def parsePublicMatchesOpenDota(self,jsonDump):
         '''parse match response from Open Dota /publicMatches endpoint
         remove non ranked games: https://github.com/odota/dotaconstants/blob/master/json/lobby_type.json shows types
         remove games less than 15minutes: study https://cosx.org/2017/05/rdota2-seattle-prediction/
+        filters + converts in plain python: building a DataFrame costs more than it saves at every measured size (benchmarks.benchParse)
+        start_time is emitted as a timezone aware UTC datetime so it is stored as a native BSON date
         params--
         json: api response 
         return: parsed data: dict
         ''' 
-        matches = pd.DataFrame.from_dict(jsonDump)
-        matches = matches.loc[matches['game_mode']==22] #only keep ranked matches
+        parsed=[]
+        for match in jsonDump:
+            if(match.get('game_mode')==RANKED_GAME_MODE and match.get('lobby_type') in RANKED_LOBBY_TYPES and (match.get('duration') or 0)>MIN_DURATION):
+                match=dict(match)
+                match['start_time']=datetime.fromtimestamp(match['start_time'],timezone.utc)
+                parsed.append(match)
         if(self.logger):
-            self.logger.info('Filtered for game mode')
-        matches = matches.loc[(matches['lobby_type']==7)| (matches['lobby_type']==6) ] #only keep ranked lobbies 6=forced solo mm 7=normal ranked lobby
-        if(self.logger):
-            self.logger.info('Filtered for lobby type')
-        matches = matches.loc[matches['duration']>900] #only keep games >15minutes
-        if(self.logger):
-            self.logger.info('Filtered for duration>15min')
-        #helper function for parseMatches ## convert unix epoch time to datetime 
-        
-        matches['start_time']=matches.apply(self.__convertUnixTime,axis=1) #convert time 
-        if(self.logger):
-            self.logger.info('Match start time converted to datetime')
-        return matches.to_dict(orient='records')
-
-    def __convertUnixTime(self,row):
-        return strftime('%Y-%m-%d %H:%M:%S',localtime(row['start_time']))
+            self.logger.info('Filtered + converted {} of {} matches'.format(len(parsed),len(jsonDump)))
+        return parsed
 
 
 '''Testing inserting heroes 
@@ -0,0 +1,157 @@
+import time
+import queue
+import threading
+import metrics
+
+_DONE=object() #end of stream marker passed down the stages
+
+class Stage(object):
+    def __init__(self,name,fn,workers=1,failedKey=None):
+        '''one step of a Pipeline: fn is applied to every item by a pool of worker threads
+        params---
+            name: str: shown in the report
+            fn: callable(item): result passed to the next stage, None drops the item
+            workers: int: number of threads running fn
+            failedKey: callable(item): what is kept in failed for an item that raised e.g. a small id instead of a whole page: default the item
+        '''
+        self.name=name
+        self.fn=fn
+        self.workers=workers
+        self.failedKey=failedKey
+        self.inQueue=None
+        self.outQueue=None
+        self.items=0
+        self.dropped=0
+        self.errors=0
+        self.busy=0.0 #seconds spent inside fn summed over workers
+        self.blocked=0.0 #seconds spent waiting on a full downstream queue (backpressure)
+        self.maxDepth=0 #deepest the input queue got
+        self.failed=[] #every item (or failedKey of it) that raised, for reruns
+        self.__finished=0
+        self.__lock=threading.Lock()
+
+    def work(self,nextWorkers):
+        '''worker thread body: process items until every upstream worker has finished'''
+        while True:
+            depth=self.inQueue.qsize()+1
+            item=self.inQueue.get()
+            if(item is _DONE):
+                with self.__lock:
+                    self.__finished+=1
+                    last=self.__finished==self.workers
+                if(last and self.outQueue is not None): #one marker per downstream worker
+                    for _ in range(nextWorkers):
+                        self.outQueue.put(_DONE)
+                return
+            start=time.monotonic()
+            with self.__lock:
+                self.maxDepth=max(self.maxDepth,depth)
+            metrics.QUEUE_DEPTH.set(depth-1,stage=self.name)
+            try:
+                result=self.fn(item)
+            except Exception as err:
+                print('Stage {} failed on {}: {}'.format(self.name,item,err))
+                with self.__lock:
+                    self.errors+=1
+                    self.failed.append(self.failedKey(item) if self.failedKey else item)
+                continue
+            finally:
+                elapsed=time.monotonic()-start
+                with self.__lock:
+                    self.busy+=elapsed
+            metrics.STAGE_ITEMS.inc(stage=self.name)
+            with self.__lock:
+                self.items+=1
+                if(result is None):
+                    self.dropped+=1
+            if(result is not None and self.outQueue is not None):
+                start=time.monotonic()
+                self.outQueue.put(result) #blocks while the next stage is behind
+                with self.__lock:
+                    self.blocked+=time.monotonic()-start
+
+class Pipeline(object):
+    def __init__(self,queueSize=8,logging=None):
+        '''staged runner: source -> stage 1 -> ... -> stage n with a bounded queue between stages
+        stages overlap (network, parsing, db writes run at the same time) and a full queue blocks the stage
+        feeding it, so sustained throughput is set by the slowest stage and memory stays bounded
+        params---
+            queueSize: int: max items waiting between two stages
+            logging: enable logs
+        '''
+        self.queueSize=queueSize
+        self.stages=[]
+        self.elapsed=0.0
+        self.fed=0
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def addStage(self,name,fn,workers=1,failedKey=None):
+        '''append a stage (see Stage): returns self so calls can be chained'''
+        self.stages.append(Stage(name,fn,workers,failedKey))
+        return self
+
+    def run(self,source,reportInterval=None):
+        '''push every item of source through the stages and wait until all are processed
+        params---
+        source: iterable: items fed to the first stage
+        reportInterval: float: seconds between progress reports while running: default no reports
+        returns---
+        dict: see report()
+        '''
+        if(not self.stages):
+            return self.report()
+        queues=[queue.Queue(maxsize=self.queueSize) for _ in self.stages]
+        for i,stage in enumerate(self.stages):
+            stage.inQueue=queues[i]
+            stage.outQueue=queues[i+1] if i+1<len(queues) else None
+        threads=[]
+        for i,stage in enumerate(self.stages):
+            nextWorkers=self.stages[i+1].workers if i+1<len(self.stages) else 0
+            for n in range(stage.workers):
+                thread=threading.Thread(target=stage.work,args=(nextWorkers,),name='{}-{}'.format(stage.name,n),daemon=True)
+                thread.start()
+                threads.append(thread)
+        start=time.monotonic()
+        lastReport=start
+        for item in source:
+            queues[0].put(item)
+            self.fed+=1
+            if(reportInterval and time.monotonic()-lastReport>=reportInterval):
+                lastReport=time.monotonic()
+                self.elapsed=lastReport-start
+                self.__log()
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        self.elapsed=time.monotonic()-start
+        return self.report()
+
+    def report(self):
+        '''per stage throughput + queue depth
+        returns---
+        dict: {'elapsed','fed','stages':[{'name','workers','items','dropped','errors','throughput','utilisation','blocked','queueDepth','maxDepth'}],'bottleneck'}
+            throughput: items/s of wall time, utilisation: busy time / (workers * wall time)
+            the bottleneck is the stage with the highest utilisation
+        '''
+        elapsed=self.elapsed or 1e-9
+        stages=[]
+        for stage in self.stages:
+            stages.append({'name':stage.name,'workers':stage.workers,'items':stage.items,'dropped':stage.dropped,'errors':stage.errors,
+                           'throughput':round(stage.items/elapsed,2),'utilisation':round(stage.busy/(stage.workers*elapsed),3),
+                           'blocked':round(stage.blocked,2),'queueDepth':stage.inQueue.qsize() if stage.inQueue else 0,
+                           'maxDepth':stage.maxDepth})
+        bottleneck=max(stages,key=lambda s:s['utilisation'])['name'] if stages else None
+        return {'elapsed':round(self.elapsed,2),'fed':self.fed,'stages':stages,'bottleneck':bottleneck}
+
+    def __log(self):
+        report=self.report()
+        message=' | '.join('{name}: {items} ({throughput}/s) q={queueDepth}'.format(**stage) for stage in report['stages'])
+        print(message)
+        if(self.logger):
+            self.logger.info(message)
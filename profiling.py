@@ -0,0 +1,114 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+import contextlib
+from datetime import datetime, timezone
+from checkpoint import Checkpoint
+
+class RunProfile(object):
+    def __init__(self,job,directory=None):
+        '''wall time spent in each stage (http, decode, parse, write, ...) of one job run
+        spans nest: a span's time excludes the spans opened inside it, so the stage times add up to the run
+        spans are not thread safe: open them from the job's own thread
+        params---
+            job: str: name of the job e.g. populate:OpenDota
+            directory: str: where finish() writes the json report: default not written
+        '''
+        self.job=job
+        self.directory=directory
+        self.spans={} #name -> [exclusive seconds, calls]
+        self.started=datetime.now(timezone.utc)
+        self.__start=time.perf_counter()
+        self.__stack=[] #time spent in child spans of each open span
+        self.total=None
+
+    @contextlib.contextmanager
+    def span(self,name):
+        '''time the enclosed block as stage name'''
+        self.__stack.append(0.0)
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed=time.perf_counter()-start
+            children=self.__stack.pop()
+            entry=self.spans.setdefault(name,[0.0,0])
+            entry[0]+=elapsed-children
+            entry[1]+=1
+            if(self.__stack):
+                self.__stack[-1]+=elapsed
+
+    def iterate(self,name,iterable):
+        '''yield from iterable, timing each next() as stage name
+        wrap lazy sources (streamed bodies, incremental parsers, fetcher results) whose work happens on iteration
+        '''
+        iterator=iter(iterable)
+        while True:
+            with self.span(name):
+                try:
+                    item=next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        '''timing report of the run so far
+        returns---
+        dict: {'job','started','total','spans':{name:{'seconds','calls','share'}},'untracked'}
+        '''
+        total=self.total if self.total is not None else time.perf_counter()-self.__start
+        spans={name:{'seconds':round(seconds,4),'calls':calls,'share':round(seconds/total,3) if total else 0}
+               for name,(seconds,calls) in sorted(self.spans.items(),key=lambda item:-item[1][0])}
+        tracked=sum(seconds for seconds,_ in self.spans.values())
+        return {'job':self.job,'started':self.started.isoformat(),'total':round(total,4),'spans':spans,'untracked':round(max(0,total-tracked),4)}
+
+    def summary(self):
+        '''one line version of the report'''
+        report=self.report()
+        return '{} {:.2f}s: {}'.format(self.job,report['total'],', '.join('{} {:.2f}s'.format(name,span['seconds']) for name,span in report['spans'].items()))
+
+    def finish(self):
+        '''stop the clock, write the json report if a directory was given
+        returns---
+        dict: see report()
+        '''
+        self.total=time.perf_counter()-self.__start
+        report=self.report()
+        if(self.directory):
+            path=os.path.join(self.directory,'{}_{}.json'.format(self.job.replace(':','_'),self.started.strftime('%Y%m%dT%H%M%S')))
+            try:
+                Checkpoint(path).save(report)
+            except OSError as err:
+                print('Could not write timing report: {}'.format(err))
+        return report
+
+def profileCall(name,fn,*args,directory='profiles',top=30,**kwargs):
+    '''run fn once under cProfile, write the raw profile (.prof, open with pstats/snakeviz) and a top hotspot summary (.txt)
+    only the calling thread is profiled: work done in pool threads shows up as waiting
+    params---
+    name: str: file name prefix
+    fn: callable
+    directory: str: output directory
+    top: int: functions listed per ordering in the summary
+    returns---
+    (result of fn, path of .prof, path of .txt)
+    '''
+    os.makedirs(directory,exist_ok=True)
+    stamp=datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    base=os.path.join(directory,'{}_{}'.format(name.replace(':','_'),stamp))
+    profiler=cProfile.Profile()
+    try:
+        result=profiler.runcall(fn,*args,**kwargs)
+    finally:
+        profiler.dump_stats(base+'.prof')
+        out=io.StringIO()
+        stats=pstats.Stats(profiler,stream=out).strip_dirs()
+        out.write('== top {} by cumulative time ==\n'.format(top))
+        stats.sort_stats('cumulative').print_stats(top)
+        out.write('== top {} by own time ==\n'.format(top))
+        stats.sort_stats('tottime').print_stats(top)
+        with open(base+'.txt','w') as f:
+            f.write(out.getvalue())
+    return result,base+'.prof',base+'.txt'
@@ -0,0 +1,115 @@
+import copy
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from bson import json_util
+
+class QueryCache(object):
+    def __init__(self,maxSize=256,defaultTtl=300):
+        '''size bounded LRU cache of query results with per entry ttl
+        entries are grouped by namespace ('db.collection') so writes can drop everything read from that collection
+        params---
+            maxSize: int: max number of cached results, least recently used are evicted first
+            defaultTtl: float: seconds a result stays valid when no ttl is given
+        '''
+        self.maxSize=maxSize
+        self.defaultTtl=defaultTtl
+        self.__entries=OrderedDict() #(namespace, key) -> (expires, value)
+        self.__lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.invalidations=0
+
+    @staticmethod
+    def key(method,*args,**kwargs):
+        '''canonical hash of a call: extended json keeps dates/ObjectIds distinct, dict key order is kept as it matters to $sort/$project'''
+        return hashlib.sha1(json_util.dumps([method,args,kwargs]).encode('utf-8')).hexdigest()
+
+    def get(self,namespace,key):
+        '''look up a cached result
+        returns---
+        (hit: bool, value)
+        '''
+        with self.__lock:
+            entry=self.__entries.get((namespace,key))
+            if(entry is None or entry[0]<time.monotonic()):
+                if(entry is not None):
+                    del self.__entries[(namespace,key)]
+                self.misses+=1
+                return False,None
+            self.__entries.move_to_end((namespace,key))
+            self.hits+=1
+            return True,entry[1]
+
+    def set(self,namespace,key,value,ttl=None):
+        '''store a result, evicting least recently used entries beyond maxSize'''
+        with self.__lock:
+            self.__entries[(namespace,key)]=(time.monotonic()+(self.defaultTtl if ttl is None else ttl),value)
+            self.__entries.move_to_end((namespace,key))
+            while(len(self.__entries)>self.maxSize):
+                self.__entries.popitem(last=False)
+                self.evictions+=1
+
+    def invalidate(self,namespace=None):
+        '''drop every entry of a namespace (or everything)
+        returns---
+        int: number of entries dropped
+        '''
+        with self.__lock:
+            stale=[entry for entry in self.__entries if namespace is None or entry[0]==namespace]
+            for entry in stale:
+                del self.__entries[entry]
+            self.invalidations+=len(stale)
+            return len(stale)
+
+    def stats(self):
+        '''hit/miss statistics: dict'''
+        with self.__lock:
+            lookups=self.hits+self.misses
+            return {'size':len(self.__entries),'maxSize':self.maxSize,'hits':self.hits,'misses':self.misses,
+                    'hitRate':self.hits/lookups if lookups else 0,'evictions':self.evictions,'invalidations':self.invalidations}
+
+defaultCache=QueryCache() #shared by every dbHandler in the process so writes invalidate other handlers' reads
+
+def cached(ttl=None):
+    '''cache the result of a dbHandler query method in self.cache
+    the wrapped method accepts two extra keyword args:
+        useCache: bool: False bypasses the cache for this call
+        cacheTtl: float: ttl for this call's result
+    params---
+    ttl: float: default ttl of the method's results: default cache.defaultTtl
+    '''
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self,*args,useCache=None,cacheTtl=None,**kwargs):
+            cache=self.cache
+            if(cache is None or useCache is False or self.collection is None):
+                return fn(self,*args,**kwargs)
+            namespace='{}.{}'.format(self.dbName,self.collectionName)
+            try:
+                key=cache.key(fn.__name__,*args,**kwargs)
+            except TypeError: #arguments that cannot be serialised are not cached
+                return fn(self,*args,**kwargs)
+            hit,value=cache.get(namespace,key)
+            if(hit):
+                return copy.deepcopy(value) #callers may mutate results
+            value=fn(self,*args,**kwargs)
+            if(value is not None): #None means the query failed
+                cache.set(namespace,key,copy.deepcopy(value),ttl=cacheTtl if cacheTtl is not None else ttl)
+            return value
+        return wrapper
+    return decorator
+
+def invalidates(fn):
+    '''drop cached results of the handler's collection once the wrapped write method has run'''
+    @functools.wraps(fn)
+    def wrapper(self,*args,**kwargs):
+        try:
+            return fn(self,*args,**kwargs)
+        finally:
+            if(self.cache is not None):
+                self.cache.invalidate('{}.{}'.format(self.dbName,self.collectionName))
+    return wrapper
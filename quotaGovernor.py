@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import threading
+from email.utils import parsedate_to_datetime
+import metrics
+try:
+    import fcntl #file locks: share buckets between processes
+except ImportError: #not on windows: buckets are then only shared between threads
+    fcntl=None
+
+#published limits per upstream host: tokens added per second + bucket size (max burst)
+DEFAULT_LIMITS={
+    'api.opendota.com':{'rate':1.0,'burst':10}, #free tier: 60 calls/minute
+    'api.steampowered.com':{'rate':100000/86400,'burst':10}, #100k calls/day per key
+    'api.github.com':{'rate':60/3600,'burst':10}, #unauthenticated: 60 calls/hour
+}
+#remaining-calls headers, most specific window first
+REMAINING_HEADERS=('X-Rate-Limit-Remaining-Minute','X-RateLimit-Remaining','RateLimit-Remaining','X-Rate-Limit-Remaining-Day')
+RESET_HEADERS=('X-RateLimit-Reset','RateLimit-Reset')
+
+class RateLimitError(Exception):
+    def __init__(self,host,status,retryAfter=None):
+        '''upstream answered 429/503: raised by ApiHandler.sendRequest so the request is retried once the governor allows it
+        params---
+            host: str
+            status: int: http status
+            retryAfter: float: seconds the server asked us to wait or None
+        '''
+        super().__init__('{} rate limited by {} (retry after {}s)'.format(status,host,retryAfter))
+        self.host=host
+        self.status=status
+        self.retryAfter=retryAfter
+
+def parseRetryAfter(value,now=None):
+    '''Retry-After header (seconds or http date) as seconds from now or None'''
+    if(value is None):
+        return None
+    try:
+        return max(0.0,float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0,parsedate_to_datetime(value).timestamp()-(now or time.time()))
+    except (TypeError,ValueError):
+        return None
+
+class QuotaGovernor(object):
+    def __init__(self,stateDir='.quota',limits=None,maxPenalty=300,logging=None):
+        '''token bucket per upstream host kept in a small json file so every process using the same stateDir shares it
+        each state change happens under an exclusive file lock (fcntl.flock) on the host's lock file
+        params---
+            stateDir: str: directory holding <host>.json state + <host>.lock files
+            limits: dict: host -> {'rate': tokens/s, 'burst': bucket size}: default DEFAULT_LIMITS, unknown hosts are unlimited
+                          but still honour Retry-After/429 blocks (kept in process: acquire never touches their lock or file)
+            maxPenalty: float: max seconds a host is blocked after a 429 without Retry-After (doubles per consecutive 429)
+            logging: enable logs
+        '''
+        self.stateDir=stateDir
+        self.limits=dict(DEFAULT_LIMITS if limits is None else limits)
+        self.maxPenalty=maxPenalty
+        self.__threadLock=threading.Lock() #flock is per process: threads of one process also need a lock
+        self.__blockedUntil={} #unlimited host -> epoch seconds it is blocked until
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def __paths(self,host):
+        name=host.replace(':','_').replace('/','_')
+        return os.path.join(self.stateDir,name+'.json'),os.path.join(self.stateDir,name+'.lock')
+
+    def __update(self,host,fn):
+        '''run fn(state, now) -> result under the host's lock, persisting the state it modifies'''
+        statePath,lockPath=self.__paths(host)
+        os.makedirs(self.stateDir,exist_ok=True)
+        with self.__threadLock:
+            with open(lockPath,'a') as lock:
+                if(fcntl):
+                    fcntl.flock(lock,fcntl.LOCK_EX)
+                try:
+                    try:
+                        with open(statePath,'r') as f:
+                            state=json.load(f)
+                    except (FileNotFoundError,ValueError):
+                        state={}
+                    now=time.time()
+                    limit=self.limits.get(host)
+                    if(limit):
+                        #refill for the time passed since the last update by any process
+                        tokens=state.get('tokens',limit['burst'])
+                        state['tokens']=min(limit['burst'],tokens+(now-state.get('updated',now))*limit['rate'])
+                    state['updated']=now
+                    state['host']=host #file names escape ':' of host:port
+                    result=fn(state,now)
+                    tmpPath=statePath+'.tmp'
+                    with open(tmpPath,'w') as f:
+                        json.dump(state,f)
+                    os.replace(tmpPath,statePath)
+                    return result
+                finally:
+                    if(fcntl):
+                        fcntl.flock(lock,fcntl.LOCK_UN)
+
+    def acquire(self,host,timeout=None):
+        '''take a token for host, sleeping until one is available and any Retry-After block has passed
+        params---
+        host: str: network location e.g. api.opendota.com
+        timeout: float: give up after this many seconds: default wait as long as needed
+        returns---
+        float: seconds waited
+        raises---
+        RateLimitError if timeout passed
+        '''
+        limit=self.limits.get(host)
+        def take(state,now):
+            blocked=state.get('blockedUntil',0)-now
+            if(blocked>0):
+                return blocked,state['tokens']
+            if(state['tokens']>=1):
+                state['tokens']-=1
+                return 0,state['tokens']
+            return (1-state['tokens'])/limit['rate'],state['tokens']
+        waited=0.0
+        while True:
+            if(limit is None): #no bucket: only a block observed by this process can hold the request
+                wait=self.__blockedUntil.get(host,0)-time.time()
+            else:
+                wait,tokens=self.__update(host,take)
+                metrics.QUOTA_TOKENS.set(tokens,host=host)
+            if(wait<=0):
+                return waited
+            if(timeout is not None and waited+wait>timeout):
+                raise RateLimitError(host,429,wait)
+            if(self.logger):
+                self.logger.info('Quota for {} exhausted, waiting {:.2f}s'.format(host,wait))
+            time.sleep(wait)
+            waited+=wait
+            metrics.QUOTA_WAIT_SECONDS.inc(wait,host=host)
+
+    def observe(self,host,response):
+        '''adapt to the rate limit information of a response
+        - 429/503 with Retry-After: block the host for that long
+        - 429 without: block for a penalty doubling per consecutive 429 up to maxPenalty
+        - remaining calls header: local bucket never holds more tokens than the server says are left
+          and at 0 the host is blocked until the reset header (if any)
+        returns---
+        float: seconds the host is now blocked for (0 if not)
+        '''
+        status=response.status_code
+        headers=response.headers
+        retryAfter=parseRetryAfter(headers.get('Retry-After'))
+        remaining=next((headers.get(name) for name in REMAINING_HEADERS if headers.get(name) is not None),None)
+        reset=next((headers.get(name) for name in RESET_HEADERS if headers.get(name) is not None),None)
+        if(status not in (429,503) and remaining is None and not self.limits.get(host)):
+            return 0 #nothing to record: skip the lock
+        def apply(state,now):
+            if(status==429 or (status==503 and retryAfter is not None)):
+                if(retryAfter is None):
+                    state['penalty']=min(self.maxPenalty,state.get('penalty',0.5)*2)
+                    wait=state['penalty']
+                else:
+                    wait=retryAfter
+                state['blockedUntil']=max(state.get('blockedUntil',0),now+wait)
+                if('tokens' in state):
+                    state['tokens']=0
+            elif(status<400):
+                state.pop('penalty',None)
+            if(remaining is not None):
+                try:
+                    left=float(remaining)
+                    state['serverRemaining']=left
+                    if('tokens' in state):
+                        state['tokens']=min(state['tokens'],left)
+                    if(left<=0 and reset is not None):
+                        resetAt=float(reset)
+                        #either epoch seconds or seconds from now
+                        state['blockedUntil']=max(state.get('blockedUntil',0),resetAt if resetAt>1e9 else now+resetAt)
+                except ValueError:
+                    pass
+            return max(0,state.get('blockedUntil',0)-now)
+        blocked=self.__update(host,apply)
+        if(blocked and not self.limits.get(host)):
+            self.__blockedUntil[host]=max(self.__blockedUntil.get(host,0),time.time()+blocked)
+        if(blocked and self.logger):
+            self.logger.info('{} blocked for {:.1f}s after status {}'.format(host,blocked,status))
+        return blocked
+
+    def __knownHosts(self):
+        '''hosts with a state file written by any process'''
+        names=os.listdir(self.stateDir) if os.path.isdir(self.stateDir) else []
+        for name in names:
+            if(name.endswith('.json')):
+                try:
+                    with open(os.path.join(self.stateDir,name),'r') as f:
+                        yield json.load(f).get('host',name[:-5])
+                except (FileNotFoundError,ValueError):
+                    pass
+
+    def remaining(self,host=None):
+        '''current budget per host
+        params---
+        host: str: only this host: default every host with a limit or a state file
+        returns---
+        dict: host -> {'tokens','burst','rate','blockedFor','serverRemaining'}
+        '''
+        hosts=[host] if host else sorted(set(self.limits)|set(self.__knownHosts()))
+        budget={}
+        for name in hosts:
+            limit=self.limits.get(name) or {}
+            state=self.__update(name,lambda state,now: dict(state,blockedFor=max(0,state.get('blockedUntil',0)-now)))
+            budget[name]={'tokens':round(state['tokens'],2) if 'tokens' in state else None,'burst':limit.get('burst'),'rate':limit.get('rate'),
+                          'blockedFor':round(state['blockedFor'],2),'serverRemaining':state.get('serverRemaining')}
+        return budget
+
+_governors={}
+_governorsLock=threading.Lock()
+
+def getGovernor(stateDir=None,**options):
+    '''process wide governor for a state directory (options only apply to the first call)
+    params---
+    stateDir: str: default DOTA2_QUOTA_DIR env var or .quota: processes sharing it share their budgets
+    '''
+    stateDir=stateDir or os.getenv('DOTA2_QUOTA_DIR','.quota')
+    with _governorsLock:
+        if(stateDir not in _governors):
+            _governors[stateDir]=QuotaGovernor(stateDir,**options)
+        return _governors[stateDir]
@@ -0,0 +1,144 @@
+import os
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import apiHandler
+import dbHandler
+import parseData
+from checkpoint import Checkpoint
+
+#OpenDota avg_rank_tier brackets: tens digit = medal (1 herald .. 8 immortal), units = stars
+RANK_BRACKETS=[(10,15),(20,25),(30,35),(40,45),(50,55),(60,65),(70,75),(80,85)]
+
+def pageBounds(data):
+    '''(lowest match_id, earliest start_time as utc datetime) of a raw /publicMatches page, (None, None) if empty'''
+    if(not data):
+        return None,None
+    lowest=min(data,key=lambda match: match['match_id'])
+    return lowest['match_id'],datetime.fromtimestamp(min(match['start_time'] for match in data),timezone.utc)
+
+def backfillBracket(minRank,maxRank,untilMatchId=None,untilDate=None,startMatchId=None,checkpointDir='checkpoints',conStr=None,collectionName='matches',maxFailures=5,logging=None):
+    '''page backwards through OpenDota /publicMatches of one rank bracket with less_than_match_id, persisting progress after every page
+    params---
+    minRank/maxRank: int: avg rank tier bounds (inclusive) e.g. 10, 15 for herald
+    untilMatchId: int: stop once pages reach matches with this id or lower
+    untilDate: datetime: utc: stop once pages reach matches started before this
+    startMatchId: int: first page holds matches below this id: default the newest matches (ignored when resuming)
+    checkpointDir: str: directory holding bracket checkpoints: a checkpoint done for another until target is resumed from where it stopped
+    conStr: str: mongodb connection string: default MONGO_CONNECTION_STR env var
+    collectionName: str: collection to insert matches into
+    maxFailures: int: consecutive failed requests before the bracket gives up (rerun resumes it)
+    logging: enable logs
+    returns---
+    state: dict: final checkpoint of bracket
+    '''
+    logger=None
+    if(logging):
+        import logging
+        logging.basicConfig(level=logging.NOTSET)
+        logger=logging.getLogger(__name__)
+    checkpoint=Checkpoint(os.path.join(checkpointDir,'opendota_rank_{}_{}.json'.format(minRank,maxRank)))
+    target={'untilMatchId':untilMatchId,'untilDate':untilDate.isoformat() if untilDate is not None else None}
+    state=checkpoint.load(dict({'minRank':minRank,'maxRank':maxRank,'next':startMatchId,'pages':0,'received':0,'inserted':0,'oldest':None,'done':False},**target))
+    if(state.get('untilMatchId')!=target['untilMatchId'] or state.get('untilDate')!=target['untilDate']):
+        #new target: everything above next is already crawled, keep paging down from there until the new target is reached
+        state.update(target,done=False)
+    if(state['done']):
+        return state
+    api=apiHandler.ApiHandler() #every bracket thread draws from the same process wide quota governor
+    db=dbHandler.dbHandler(conStr or os.getenv('MONGO_CONNECTION_STR'),rollups=(collectionName=='matches'),shared=True,seen=True,queue=(collectionName=='matches'))
+    db.connect(id='match_id',dbName='dota2',collectionName=collectionName)
+    parse=parseData.parseData()
+    failures=0
+    reached=False
+    try:
+        while not reached:
+            params={'min_rank':minRank,'max_rank':maxRank}
+            if(state['next'] is not None):
+                params['less_than_match_id']=state['next']
+            data=api.sendRequest(api.fetchPublicMatches(**params))
+            if(not isinstance(data,list)): #failed request returns None / error payload
+                failures+=1
+                print('Bracket {}-{} request failed ({}): {}'.format(minRank,maxRank,failures,data))
+                if(failures>=maxFailures):
+                    break
+                time.sleep(2**failures)
+                continue
+            lowestId,earliest=pageBounds(data)
+            if(lowestId is None): #no older matches in this bracket
+                reached=True
+                break
+            matches=parse.parsePublicMatchesOpenDota(data)
+            if(untilMatchId is not None):
+                reached=lowestId<=untilMatchId
+                matches=[match for match in matches if match['match_id']>untilMatchId]
+            if(untilDate is not None):
+                reached=reached or earliest<untilDate
+                matches=[match for match in matches if match['start_time']>=untilDate]
+            inserted=db.ingestData(matches) if matches else {'new':0}
+            if(inserted is None or inserted.get('errors')): #write failed: page is retried from the same position
+                failures+=1
+                print('Bracket {}-{} write failed ({}): {}'.format(minRank,maxRank,failures,inserted))
+                if(failures>=maxFailures):
+                    break
+                time.sleep(2**failures)
+                continue
+            failures=0
+            #the next page starts below the lowest id of the raw page: filtered out matches still count as seen
+            state['next']=lowestId
+            state['pages']+=1
+            state['received']+=len(data)
+            state['inserted']+=inserted['new']
+            state['oldest']=earliest.isoformat()
+            checkpoint.save(state)
+            if(logger):
+                logger.info('Bracket {}-{} below match {} ({})'.format(minRank,maxRank,lowestId,state['oldest']))
+        state['done']=reached
+        checkpoint.save(state)
+    finally:
+        api.close()
+        db.endSession()
+    return state
+
+class RankBackfill(object):
+    def __init__(self,brackets=None,untilMatchId=None,untilDate=None,startMatchId=None,workers=None,checkpointDir='checkpoints',conStr=None,collectionName='matches',logging=None):
+        '''backfill historical OpenDota public matches with one thread per rank bracket paging backwards concurrently
+        each bracket keeps its own checkpoint so rerunning with the same brackets resumes every bracket where it stopped
+        params---
+            brackets: list of (minRank, maxRank): default RANK_BRACKETS
+            untilMatchId: int: stop every bracket at this match id
+            untilDate: datetime: utc: stop every bracket at matches started before this
+            startMatchId: int: start below this match id instead of the newest matches
+            workers: int: brackets paged at once: default all of them
+            checkpointDir: str: directory holding bracket checkpoints
+            conStr: str: mongodb connection string: default MONGO_CONNECTION_STR env var
+            collectionName: str: collection to insert matches into
+            logging: enable logs
+        '''
+        if(untilMatchId is None and untilDate is None):
+            raise ValueError('RankBackfill needs untilMatchId or untilDate')
+        self.brackets=list(brackets or RANK_BRACKETS)
+        self.untilMatchId=untilMatchId
+        self.untilDate=untilDate
+        self.startMatchId=startMatchId
+        self.workers=workers or len(self.brackets)
+        self.checkpointDir=checkpointDir
+        self.conStr=conStr
+        self.collectionName=collectionName
+        self.logging=logging
+
+    def run(self):
+        '''run every bracket and wait for them to finish
+        returns---
+        list of final bracket states
+        '''
+        if(not self.brackets):
+            return []
+        with ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix='rankBackfill') as pool:
+            futures=[pool.submit(backfillBracket,minRank,maxRank,self.untilMatchId,self.untilDate,self.startMatchId,self.checkpointDir,self.conStr,self.collectionName,5,self.logging)
+                     for minRank,maxRank in self.brackets]
+            states=[future.result() for future in futures]
+        for state in states:
+            print('Bracket {}-{}: {} matches inserted from {} pages, {}'.format(state['minRank'],state['maxRank'],state['inserted'],state['pages'],
+                  'done' if state['done'] else 'incomplete below match {}'.format(state['next'])))
+        return states
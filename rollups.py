@@ -0,0 +1,214 @@
+from datetime import datetime, timezone
+from pymongo import UpdateOne, errors
+from indexSpecs import INDEX_SPECS, ensureIndexes
+
+def dayKey(startTime):
+    '''day a match belongs to: str %Y-%m-%d
+    params---
+    startTime: utc datetime, legacy local time str '%Y-%m-%d %H:%M:%S' or raw unix epoch int
+    '''
+    if(isinstance(startTime,str)):
+        return startTime[:10]
+    if(isinstance(startTime,datetime)):
+        if(startTime.tzinfo is not None):
+            startTime=startTime.astimezone(timezone.utc)
+        return startTime.strftime('%Y-%m-%d')
+    return datetime.fromtimestamp(startTime,timezone.utc).strftime('%Y-%m-%d')
+
+def periodKey(day,interval):
+    '''map a day key onto the same buckets the aggregation pipelines use
+    params---
+    day: str %Y-%m-%d
+    interval: str: day/week/other=monthly
+    '''
+    if(interval=='day'):
+        return day
+    if(interval=='week'):
+        return datetime.strptime(day,'%Y-%m-%d').strftime('%Y-%U')
+    return day[:7]
+
+def dayRange(field,start=None,end=None):
+    '''filter on a day key field for [start, end): empty dict if unbounded'''
+    bounds={}
+    if(start is not None):
+        bounds['$gte']=dayKey(start)
+    if(end is not None):
+        bounds['$lt']=dayKey(end)
+    return {field:bounds} if bounds else {}
+
+def rate(won,total):
+    '''percentage matching the $cond/$divide/$multiply used in the pipelines'''
+    return (won/total)*100 if total>0 else 0
+
+class RollupManager(object):
+    def __init__(self,db,collectionName,logging=None):
+        '''maintains per day and per (hero, day) counters for a matches collection
+        rollups live in <collectionName>_rollup_daily and <collectionName>_rollup_hero_daily
+        <collectionName>_rollup_meta records whether they cover every match (rebuilt, or maintained since the collection was empty)
+        params---
+            db: pymongo database holding the matches collection
+            collectionName: str: name of matches collection
+            logging: enable logs
+        '''
+        self.collectionName=collectionName
+        self.daily=db['{}_rollup_daily'.format(collectionName)]
+        self.heroDaily=db['{}_rollup_hero_daily'.format(collectionName)]
+        self.meta=db['{}_rollup_meta'.format(collectionName)]
+        self.__seeded=False
+        self.heroDailySpecs=INDEX_SPECS.get(self.heroDaily.name,INDEX_SPECS['matches_rollup_hero_daily'])
+        ensureIndexes(self.heroDaily,specs=self.heroDailySpecs) #once per process
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def seeded(self):
+        '''True once the rollups cover every match: until then reads should scan the matches collection'''
+        if(not self.__seeded):
+            state=self.meta.find_one({'_id':'state'})
+            self.__seeded=bool(state and state.get('seeded'))
+        return self.__seeded
+
+    def markSeeded(self,matches=0):
+        '''record that the rollups are complete
+        params---
+        matches: int: matches they were computed from
+        '''
+        self.meta.replace_one({'_id':'state'},{'_id':'state','seeded':True,'matches':matches,'at':datetime.now(timezone.utc)},upsert=True)
+        self.__seeded=True
+
+    def applyBatch(self,matches):
+        '''add a batch of newly inserted matches to the rollups
+        counters are summed locally then written as one $inc upsert per touched document
+        params---
+        matches: list of dict: must only contain matches that were actually inserted
+        returns---
+        int: number of rollup documents touched
+        '''
+        days={}
+        heroes={}
+        for match in matches:
+            if(match.get('start_time') is None):
+                continue
+            day=dayKey(match['start_time'])
+            radiantWin=bool(match.get('radiant_win'))
+            counts=days.setdefault(day,{'total_matches':0,'radiant_won':0})
+            counts['total_matches']+=1
+            counts['radiant_won']+=int(radiantWin)
+            for side,won in (('radiant',radiantWin),('dire',not radiantWin)):
+                for hero in match.get('{}_team'.format(side)) or []:
+                    counts=heroes.setdefault((hero,day),{'total_radiant_matches':0,'total_dire_matches':0,'radiant_won':0,'dire_won':0})
+                    counts['total_{}_matches'.format(side)]+=1
+                    counts['{}_won'.format(side)]+=int(won)
+        try:
+            if(days):
+                self.daily.bulk_write([UpdateOne({'_id':day},{'$inc':counts},upsert=True) for day,counts in days.items()],ordered=False)
+            if(heroes):
+                self.heroDaily.bulk_write([UpdateOne({'_id':'{}|{}'.format(hero,day)},{'$inc':counts,'$setOnInsert':{'hero':hero,'day':day}},upsert=True)
+                                          for (hero,day),counts in heroes.items()],ordered=False)
+        except errors.PyMongoError as err:
+            print('Error occured updating rollups: {}'.format(err))
+        if(self.logger):
+            self.logger.info('Rollups updated: {} days {} hero days'.format(len(days),len(heroes)))
+        return len(days)+len(heroes)
+
+    def rebuild(self,collection,batchSize=5000):
+        '''drop rollups and recompute them from every match in collection
+        params---
+        collection: pymongo collection of matches
+        batchSize: int: matches summed per rollup write
+        returns---
+        int: number of matches processed
+        '''
+        self.meta.delete_one({'_id':'state'}) #partial until the rebuild completes
+        self.__seeded=False
+        self.daily.drop()
+        self.heroDaily.drop()
+        ensureIndexes(self.heroDaily,specs=self.heroDailySpecs,force=True) #dropped with the collection
+        processed=0
+        batch=[]
+        projection={'_id':0,'start_time':1,'radiant_win':1,'radiant_team':1,'dire_team':1}
+        for match in collection.find({},projection,batch_size=batchSize):
+            batch.append(match)
+            if(len(batch)>=batchSize):
+                self.applyBatch(batch)
+                processed+=len(batch)
+                batch=[]
+        if(batch):
+            self.applyBatch(batch)
+            processed+=len(batch)
+        self.markSeeded(processed)
+        print('Rollups rebuilt from {} matches'.format(processed))
+        return processed
+
+    def winRateOverTime(self,interval='day',start=None,end=None):
+        '''radiant win rate per period read from daily rollups: same shape as dbHandler.getWinRateOverTime
+        params---
+        interval: str: day/week/other=monthly
+        start: datetime: first day to include
+        end: datetime: days from this one on are excluded (day granularity)
+        returns---
+        list of {'date','win_rate','total_matches'} sorted by date
+        '''
+        periods={}
+        for doc in self.daily.find(dayRange('_id',start,end)):
+            counts=periods.setdefault(periodKey(doc['_id'],interval),{'total_matches':0,'radiant_won':0})
+            counts['total_matches']+=doc.get('total_matches',0)
+            counts['radiant_won']+=doc.get('radiant_won',0)
+        return [{'date':period,'win_rate':rate(counts['radiant_won'],counts['total_matches']),'total_matches':counts['total_matches']}
+                for period,counts in sorted(periods.items())]
+
+    def heroWinRateOverTime(self,heroId=1,interval='day',start=None,end=None):
+        '''hero win rates per period read from hero rollups: same shape as dbHandler.getHeroWinRateOverTime
+        params---
+        heroId: int: id of hero
+        interval: str: day/week/other=monthly
+        start: datetime: first day to include
+        end: datetime: days from this one on are excluded (day granularity)
+        returns---
+        list of dict sorted by date
+        '''
+        periods={}
+        for doc in self.heroDaily.find({'hero':heroId,**dayRange('day',start,end)}):
+            counts=periods.setdefault(periodKey(doc['day'],interval),{'total_radiant_matches':0,'total_dire_matches':0,'radiant_won':0,'dire_won':0})
+            for key in counts:
+                counts[key]+=doc.get(key,0)
+        return [self.heroRow(period,counts) for period,counts in sorted(periods.items())]
+
+    def allHeroesWinRateOverTime(self,heroIds=None,interval='day',start=None,end=None):
+        '''win rates per period for every hero (or a subset) from one read of the hero rollups
+        params---
+        heroIds: list of int: heroes to include: default all
+        interval: str: day/week/other=monthly
+        start: datetime: first day to include
+        end: datetime: days from this one on are excluded (day granularity)
+        returns---
+        dict: {heroId: list} each list in the same shape as heroWinRateOverTime
+        '''
+        query=dayRange('day',start,end)
+        if(heroIds is not None):
+            query['hero']={'$in':heroIds}
+        periods={}
+        for doc in self.heroDaily.find(query):
+            counts=periods.setdefault((doc['hero'],periodKey(doc['day'],interval)),{'total_radiant_matches':0,'total_dire_matches':0,'radiant_won':0,'dire_won':0})
+            for key in counts:
+                counts[key]+=doc.get(key,0)
+        res={}
+        for (hero,period),counts in sorted(periods.items()):
+            res.setdefault(hero,[]).append(self.heroRow(period,counts))
+        return res
+
+    @staticmethod
+    def heroRow(period,counts):
+        '''build output row matching the $project stage of getHeroWinRateOverTime'''
+        total=counts['total_radiant_matches']+counts['total_dire_matches']
+        return {
+            'date':period,
+            'overall_win_rate':rate(counts['radiant_won']+counts['dire_won'],total),
+            'radiant_win_rate':rate(counts['radiant_won'],counts['total_radiant_matches']),
+            'dire_win_rate':rate(counts['dire_won'],counts['total_dire_matches']),
+            'total_radiant_matches':counts['total_radiant_matches'],
+            'total_dire_matches':counts['total_dire_matches'],
+        }
@@ -1,70 +1,134 @@
-import schedule 
 import time 
 import os
+import json
 import argparse
 import apiHandler
 import dbHandler
 import parseData 
+import detailFetcher
+import seqCrawler
+import rankBackfill
+import workQueue
+import checkpoint
+import connectionManager
+import adaptiveScheduler
+import metrics
+import profiling
+import quotaGovernor
 import pymongo
+from pymongo import errors
+from datetime import datetime, timezone
 
-def cyclePopulateMatches(logging=None, source="OpenDota",seqNum=None):
+def cyclePopulateMatches(logging=None, source="OpenDota",seqNum=None,stream=True,batchSize=25,report=None,profileDir=None,api=None):
     '''populate dataset work loop - opendota public matches endpoint 
     ''params--
         logging: bool: enable logging
         source:str: options[OpenDota, Steam] default OpenDota
-        seqNum: int: sequence number to use for steam call'''
+        seqNum: int: sequence number to use for steam call
+        stream: bool: steam only: parse the response incrementally and insert matches in batches as they arrive
+        batchSize: int: matches per insert when streaming
+        report: dict: filled with the run's ingest counts {'received','new','duplicates','filtered','errors'} and stage 'timings' (see profiling.RunProfile)
+        profileDir: str: write the run's timing report as json to this directory
+        api: apiHandler.ApiHandler: long lived handler whose keep-alive sessions outlive the run: default one created + closed for this run
+    returns---
+        list: (last) inserted batch or None on failure'''
     logger=None 
     if(logging==True):
         import logging
         logging.basicConfig(level=logging.NOTSET)
         logger=logging.getLogger(__name__)
+    profile = profiling.RunProfile('populate:{}'.format(source),directory=profileDir)
+    ownApi = api is None
     try:
     #setup 
-        api = apiHandler.ApiHandler()
-        db = dbHandler.dbHandler(os.getenv('MONGO_CONNECTION_STR'))
-        parse = parseData.parseData()
-        if(source=='Steam'):
-            collectionName= 'matches_steam'
-        else:
-            collectionName='matches'
-        db.connect(id='match_id',dbName='dota2',collectionName=collectionName)
+        with profile.span('connect'):
+            if(ownApi):
+                api = apiHandler.ApiHandler()
+            db = dbHandler.dbHandler(os.getenv('MONGO_CONNECTION_STR'),rollups=(source=="OpenDota"),shared=True,seen=True,queue=(source=="OpenDota")) #keep win rate rollups current as matches arrive, skip ids already stored, queue new matches for details
+            parse = parseData.parseData()
+            if(source=='Steam'):
+                collectionName= 'matches_steam'
+            else:
+                collectionName='matches'
+            db.connect(id='match_id',dbName='dota2',collectionName=collectionName)
         if(logger):
             logger.info('Connected to db: {} collection: {}'.format('dota2', collectionName))
         
         #request+parse
         if(source=="OpenDota"):
-            data = api.sendRequest(api.fetchPublicMatches())
+            with profile.span('http+decode'): #body is json decoded by sendRequest
+                data = api.sendRequest(api.fetchPublicMatches())
             if(logger):
                 logger.info('Sent API request')
-            parsed = parse.parsePublicMatchesOpenDota(data)
+            with profile.span('parse'):
+                parsed = parse.parsePublicMatchesOpenDota(data)
         elif(source=="Steam"):
-            data = api.sendRequest(api.fetchMatchHistoryBySeqNum(**{"seqNum":seqNum, "matches_requested":200}))
+            params = {"matches_requested":100}
+            if(seqNum is not None): #no position yet: steam starts from the oldest match
+                params["start_at_match_seq_num"]=seqNum
+            url = api.fetchMatchHistoryBySeqNum(**params)
+            if(stream):
+                #insert while the body is still downloading, peak memory is bounded by batchSize not page size
+                parsed,inserted = None,None
+                chunks = profile.iterate('http',api.streamRequest(url))
+                for batch in parseData.chunked(profile.iterate('decode',parse.iterMatchesSteam(chunks)),batchSize):
+                    with profile.span('write'):
+                        inserted = db.ingestData(batch)
+                    if(inserted is None):
+                        break
+                    parsed = batch
+                    if(report is not None):
+                        for key in ('received','new','duplicates','filtered','errors'):
+                            report[key]=report.get(key,0)+inserted[key]
+            else:
+                with profile.span('http+decode'):
+                    data = api.sendRequest(url)
+                with profile.span('parse'):
+                    parsed = parse.parseMatchesSteam(data)
             if(logger):
                 logger.info('Sent Steam API request')
-            parsed = parse.parseMatchesSteam(data)
         if(logger):
             logger.info('Parsed data')
         
         #insert + close 
-        db.insertData(parsed,True)
+        if(source=="OpenDota" or not stream):
+            with profile.span('write'):
+                inserted = db.ingestData(parsed) #pages overlap the previous poll: duplicates are counted not fatal
+            if(report is not None and inserted is not None):
+                report.update({k:v for k,v in inserted.items() if k!='newIds'})
         if(logger):
-            logger.info('New data inserted to db')
-        db.endSession()
+            logger.info('New data inserted to db: {}'.format({k:v for k,v in (inserted or {}).items() if k!='newIds'}))
+        with profile.span('close'):
+            db.endSession()
         if(logger):
             logger.info('db connection closed')
         print("Task completed successfully")
+        return parsed if inserted is not None else None
     except Exception as err:
         print('Error occurred: {}'.format(err))
+    finally:
+        if(ownApi and api is not None):
+            api.close()
+        timings = profile.finish()
+        print(profile.summary())
+        if(report is not None):
+            report['timings'] = timings
+    return None
 
 def getLatestSequenceNumber():
     '''check db for last steam sequence number added
+    only used to seed the crawl cursor when no position has been persisted
     returns---
-        seqNum: int''' 
-    db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"))
-    db.connect(id="match_id",dbName="dota2",collectionName="matches_steam")
-    filt = {"match_seq_num":1}
-    sort = [('match_seq_num',pymongo.DESCENDING)]
-    return db.findOne(filt,sort=sort)['match_seq_num']
+        seqNum: int or None if collection is empty''' 
+    db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"),shared=True)
+    db.connect(dbName="dota2",collectionName="matches_steam")
+    try:
+        filt = {"match_seq_num":1}
+        sort = [('match_seq_num',pymongo.DESCENDING)]
+        latest = db.findOne(filt,sort=sort)
+        return latest['match_seq_num'] if latest else None
+    finally:
+        db.endSession()
 
 def fetchDetails(api,db,matchId=None, matchSeqNum=None, logging=None):
     '''get details from steam endpoint of matchid ** endpoint down making workaround by using sequence number
@@ -101,9 +165,11 @@ def fetchDetails(api,db,matchId=None, matchSeqNum=None, logging=None):
     return None 
 
 
-def updateDetails(match,db):
+def updateDetails(match,db,buffered=False):
     ''' handle preparing to merge with db
     :params: match (dict) 
+    :params: buffered (bool) queue the update for the next bulk write instead of writing immediately
+    :return (dict) bulk batch stats if a buffered write triggered a flush else None
     '''
     try:
         #first fetch corresponding match from db
@@ -111,6 +177,8 @@ def updateDetails(match,db):
         #we want the old duration as that has been parsed already so delete that entry
         del match["start_time"]
         match["detailed"]= True         #adding this to track which matches have been expanded to include full details 
+        if(buffered):
+            return db.bufferUpdate(match, query={"match_seq_num":seq_num})
         db.updateData(match,many=False, query={"match_seq_num":seq_num})
     except errors.PyMongoError as err:
         print("DB error occured: {}".format(err))
@@ -118,48 +186,142 @@ def updateDetails(match,db):
         print("Exception : {}".format(e))
 
 
-def mergeMatches(logging=None):
-    '''check db for entries without details, fetch those details from steam api, merge into db '''
+def mergeMatches(logging=None, workers=8, batchSize=1000, profileDir=None, maxBatches=None, api=None):
+    '''claim undetailed matches from the work queue, fetch those details from steam api, merge into db
+    several merge processes can run at once: each claims its own batches (see workQueue.WorkQueue)
+    :params: logging (bool) enable logging
+    :params: workers (int) number of concurrent detail requests
+    :params: batchSize (int) number of matches claimed + written per bulk write
+    :params: profileDir (str) write the run's timing report as json to this directory
+    :params: maxBatches (int) stop after claiming this many batches: default until the queue is drained
+    :params: api (apiHandler obj) long lived handler shared by the fetcher threads: default one created + closed for this run
+    :return (dict) {'received': matches fetched, 'new': matches detailed, 'errors', 'timings'} or None on failure'''
     logger=None 
     if(logging==True):
         import logging
         logging.basicConfig(level=logging.NOTSET)
         logger=logging.getLogger(__name__)
+    profile = profiling.RunProfile('merge',directory=profileDir)
+    ownApi = api is None
     try:
-        #get matches to update
-        db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"))
-        db.connect(dbName="dota2", collectionName="matches", id="match_id")
-        matchesToExpand = db.findAll(filt={"detailed": {"$exists":False}}) # could also just filter for this value being true but may as well use mongo feature to make it slightly faster
+        with profile.span('connect'):
+            db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"),bulkSize=batchSize,shared=True,queue=True)
+            db.connect(dbName="dota2", collectionName="matches", id="match_id")
+            queue = db.queue
+        with profile.span('query'):
+            if(queue.isEmpty()): #matches stored before the queue existed
+                queue.seed(db.collection)
+            backlog = queue.counts()['pending'] #served by the queue's state index, no scan of matches
+        metrics.BACKLOG.set(backlog)
         if(logger):
-            logger.info("Found {} matches to update".format(db.collection.count_documents({"detailed":{"$exists":False}})))
-        print("Found {} matches to update".format(db.collection.count_documents({"detailed":{"$exists":False}})))
-        #make 1 API instance 
-        api = apiHandler.ApiHandler()
-        for match in matchesToExpand: #loop through and update each 
-            seq_num = match.get("match_seq_num")
-            if not seq_num:
-                #perhaps add some indication through logger or print? 
-                continue
-            detailed = fetchDetails(api,db,matchSeqNum=seq_num) #make call
-            updateDetails(detailed,db) #update entry 
-            if(logger):
-                logger.info("Updated match {}".format(match.get("match_id")))
-        db.endSession()
+            logger.info("Found {} matches to update".format(backlog))
+        print("Found {} matches to update".format(backlog))
+        #1 API instance shared by the fetcher threads
+        if(ownApi):
+            api = apiHandler.ApiHandler()
+        fetcher = detailFetcher.DetailFetcher(api,maxWorkers=workers,logging=logging)
+        totals={'batch':0,'matched':0,'modified':0,'errors':0}
+        queued={'completed':0,'released':0}
+        batches=0
+        while(maxBatches is None or batches<maxBatches):
+            with profile.span('query'):
+                token,claimed = queue.claim(batchSize)
+            if(not claimed):
+                break
+            batches+=1
+            matchIds = {doc['seq']:doc['_id'] for doc in claimed}
+            fetched,missing = [],[]
+            batchErrors = 0
+            for seq_num, detailed in profile.iterate('fetch',fetcher.fetchAll(matchIds)): #results come back in seq num order, fetch = waiting on detail requests
+                if detailed is None:
+                    missing.append(matchIds[seq_num])
+                    continue
+                fetched.append(matchIds[seq_num])
+                with profile.span('write'):
+                    stats = updateDetails(detailed,db,buffered=True) #queue update, written in bulk
+                if(stats):
+                    batchErrors+=stats['errors']
+                    for key in totals:
+                        totals[key]+=stats[key]
+                    if(logger):
+                        logger.info("Bulk update written: {}".format(stats))
+            with profile.span('write'):
+                stats = db.flushUpdates() #write remaining partial batch
+            if(stats):
+                batchErrors+=stats['errors']
+                for key in totals:
+                    totals[key]+=stats[key]
+            with profile.span('queue'):
+                if(batchErrors): #can't tell which update failed: updates are idempotent so the batch is retried without using up attempts
+                    queued['released']+=queue.release(fetched,token,countAttempt=False)
+                    fetched=[]
+                queued['completed']+=queue.complete(fetched,token)
+                queued['released']+=queue.release(missing,token) #e.g. not yet available from steam: claimable again after the queue's retryDelay
+            metrics.BACKLOG.set(max(0,backlog-queued['completed']))
+        print(fetcher.report())
+        print("Bulk updates: {} queued {} matched {} modified {} errors".format(totals['batch'],totals['matched'],totals['modified'],totals['errors']))
+        print("Work queue: {} batches claimed, {} completed, {} released".format(batches,queued['completed'],queued['released']))
+        with profile.span('close'):
+            db.endSession()
         if(logger):
             logger.info("DB session closed")
         print("Detailed update task completed")
+        return {'received':fetcher.stats['matches'],'new':totals['modified'],'errors':totals['errors']+fetcher.stats['missing'],'timings':profile.finish()}
     except Exception as e:
         print("Exception occured : {}".format(e))
+        profile.finish()
+    finally:
+        if(ownApi and api is not None):
+            api.close()
+        print(profile.summary())
+    return None
+
+def populateJob(logging=None, source="OpenDota", cursor=None, profileDir=None, api=None):
+    '''cyclePopulateMatches as an adaptive scheduler job
+    :params: cursor (checkpoint.CrawlCursor) steam crawl position, advanced past each inserted batch
+    :params: profileDir (str) write the run's timing report as json to this directory
+    :params: api (apiHandler obj) handler kept by the scheduler across runs
+    :return (dict) ingest counts of the run or None on failure'''
+    report = {}
+    batch = cyclePopulateMatches(logging,source,cursor.position if cursor else None,report=report,profileDir=profileDir,api=api)
+    if(batch is None):
+        return None
+    if(cursor is not None):
+        cursor.advance(batch) #position only moves past successfully inserted batches
+        print("current seqNum:{}".format(cursor.position))
+        report['received']=max(report.get('received',0),100) #yield = page fullness: short pages mean the crawl caught up
+    return report
 
 #handle input options to set scheduler
 parser= argparse.ArgumentParser('E.g.')
-parser.add_argument("--source",help="Source API to use: valid options:[Steam, OpenDota (default if none given)]",type=str,default="OpenDota",required=False, dest="source")
+parser.add_argument("--source",help="Source API(s) to use, comma separated to run several in one loop: valid options:[Steam, OpenDota (default if none given)]",type=str,default="OpenDota",required=False, dest="source")
 #parser.add_argument("--seqNum", help="Required for steamAPI, sequenceNumber to start from",type=int,default=None,required=False,dest="seqNum")
 parser.add_argument("--logging",help="Enable logging, True/False",type=bool,default=False, required=False,dest="logging")
-args = parser.parse_args()
-source = args.source 
-#seqNum = args.seqNum
-logging = args.logging 
+parser.add_argument("--workers",help="Number of concurrent match detail requests",type=int,default=8,required=False,dest="workers")
+parser.add_argument("--batchSize",help="Number of detailed matches written per bulk write",type=int,default=1000,required=False,dest="batchSize")
+parser.add_argument("--backfill",help="Steam only: crawl match_seq_num range START END in parallel shards then exit",type=int,nargs=2,default=None,required=False,dest="backfill",metavar=("START","END"))
+parser.add_argument("--pipeline",help="Run --backfill in one process as overlapping fetch/parse/write stages instead of shard processes",action="store_true",default=False,required=False,dest="pipeline")
+parser.add_argument("--stageWorkers",help="Threads of the fetch, parse and write stages used by --pipeline",type=int,nargs=3,default=[8,2,2],required=False,dest="stageWorkers",metavar=("FETCH","PARSE","WRITE"))
+parser.add_argument("--shards",help="Number of parallel shards/worker processes used by --backfill",type=int,default=4,required=False,dest="shards")
+parser.add_argument("--rebuildRollups",help="Recompute win rate rollups of the matches collection from scratch then exit",action="store_true",default=False,required=False,dest="rebuildRollups")
+parser.add_argument("--checkIndexes",help="Create declared indexes, report drift and flag queries that COLLSCAN then exit",action="store_true",default=False,required=False,dest="checkIndexes")
+parser.add_argument("--migrateStartTime",help="Convert legacy string start_time values in the matches collection to native dates then exit",action="store_true",default=False,required=False,dest="migrateStartTime")
+parser.add_argument("--poolSize",help="Max connections in the shared MongoDB client pool",type=int,default=50,required=False,dest="poolSize")
+parser.add_argument("--minInterval",help="Shortest poll interval in seconds the adaptive scheduler may use",type=float,default=60,required=False,dest="minInterval")
+parser.add_argument("--maxInterval",help="Longest poll interval in seconds the adaptive scheduler may use",type=float,default=1800,required=False,dest="maxInterval")
+parser.add_argument("--reportInterval",help="Seconds between printing the current cadence of every job",type=float,default=600,required=False,dest="reportInterval")
+parser.add_argument("--metricsPort",help="Expose prometheus metrics on http://127.0.0.1:PORT/metrics (disabled if not given)",type=int,default=None,required=False,dest="metricsPort")
+parser.add_argument("--profile",help="Run one iteration of JOB under cProfile, write the .prof + top hotspots summary to --profileDir then exit",type=str,default=None,required=False,dest="profile",choices=["populate","merge"])
+parser.add_argument("--profileDir",help="Directory for --profile output and per run timing reports (timing reports are only written when given)",type=str,default=None,required=False,dest="profileDir")
+parser.add_argument("--top",help="Number of functions listed in the --profile hotspot summary",type=int,default=30,required=False,dest="top")
+parser.add_argument("--rankBackfill",help="OpenDota only: page public matches backwards per rank bracket (10-15 .. 80-85) in parallel down to --untilDate/--untilMatchId then exit",action="store_true",default=False,required=False,dest="rankBackfill")
+parser.add_argument("--untilDate",help="--rankBackfill stops at matches started before this UTC date YYYY-MM-DD",type=str,default=None,required=False,dest="untilDate")
+parser.add_argument("--untilMatchId",help="--rankBackfill stops at this match id",type=int,default=None,required=False,dest="untilMatchId")
+parser.add_argument("--bracketWorkers",help="Rank brackets paged at once by --rankBackfill (default all 8)",type=int,default=None,required=False,dest="bracketWorkers")
+parser.add_argument("--seedQueue",help="Queue every match of the matches collection still missing details for merging then exit",action="store_true",default=False,required=False,dest="seedQueue")
+parser.add_argument("--quotaDir",help="Directory of the per host rate limit buckets shared by every crawler process: default DOTA2_QUOTA_DIR or .quota",type=str,default=None,required=False,dest="quotaDir")
+parser.add_argument("--quotaStatus",help="Print the remaining rate limit budget of every upstream host then exit",action="store_true",default=False,required=False,dest="quotaStatus")
+parser.add_argument("--checkpointDir",help="Directory where shard checkpoints and crawl cursors are stored",type=str,default="checkpoints",required=False,dest="checkpointDir")
 
 '''
 api=apiHandler.ApiHandler()
@@ -173,19 +335,97 @@ json.dump(parsed,f)
 f.close()
 
 '''
-#schedule tasks
-if(source=='OpenDota'):
-    schedule.every(10).minutes.do(cyclePopulateMatches,[logging,source])
-    schedule.every(30).minutes.do(mergeMatches,logging)
-    while True:
-        schedule.run_pending()
-        time.sleep(300)
-        print('sleeping for 5 minutes')
-if(source=='Steam'):  ### TODO ::::this should match above
-    while True:
-        time.sleep(5)
-        print('sleeping for 5 seconds')
-        seqNum=getLatestSequenceNumber()
-        print("current seqNum:{}".format(seqNum))
-        cyclePopulateMatches(logging,source,seqNum)
+if __name__ == '__main__': #guard so worker processes can import this module
+    args = parser.parse_args()
+    source = args.source 
+    #seqNum = args.seqNum
+    logging = args.logging 
+    workers = args.workers
+    batchSize = args.batchSize
+    if(args.metricsPort):
+        metrics.serve(args.metricsPort)
+    if(args.quotaDir):
+        os.environ["DOTA2_QUOTA_DIR"] = args.quotaDir #inherited by backfill shard processes
+    if(args.quotaStatus):
+        print(json.dumps(quotaGovernor.getGovernor().remaining(),indent=2))
+        raise SystemExit(0)
 
+    if(args.profile):
+        job = cyclePopulateMatches if args.profile=="populate" else mergeMatches
+        jobArgs = (logging,source.split(",")[0].strip()) if args.profile=="populate" else (logging,workers,batchSize)
+        _,profPath,summaryPath = profiling.profileCall(args.profile,job,*jobArgs,directory=args.profileDir or "profiles",top=args.top,profileDir=args.profileDir or "profiles")
+        print("Profile written to {} (hotspots: {})".format(profPath,summaryPath))
+        raise SystemExit(0)
+    if(args.checkIndexes):
+        for collectionName in ("matches","matches_steam",workQueue.QUEUE_COLLECTION):
+            db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"))
+            db.connect(dbName="dota2",collectionName=collectionName)
+            report = db.checkIndexes()
+            if(report):
+                print("{}: drift {}".format(collectionName,report['drift']))
+                for plan in report['plans']:
+                    print("  {:<40} {}".format(plan['method'],','.join(plan['stages'])))
+            db.endSession()
+        raise SystemExit(0)
+    if(args.migrateStartTime):
+        db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"))
+        db.connect(dbName="dota2",collectionName="matches")
+        db.migrateStartTimes(checkpoint=checkpoint.Checkpoint(os.path.join(args.checkpointDir,'start_time_migration.json')))
+        db.rebuildRollups() #day buckets are utc days after migration
+        db.endSession()
+        raise SystemExit(0)
+    if(args.seedQueue):
+        db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"),queue=True)
+        db.connect(dbName="dota2",collectionName="matches")
+        db.queue.seed(db.collection)
+        print("Queue: {}".format(db.queue.counts()))
+        db.endSession()
+        raise SystemExit(0)
+    if(args.rebuildRollups):
+        db = dbHandler.dbHandler(os.getenv("MONGO_CONNECTION_STR"))
+        db.connect(dbName="dota2",collectionName="matches")
+        db.rebuildRollups()
+        db.endSession()
+        raise SystemExit(0)
+    if(args.rankBackfill):
+        if(args.untilDate is None and args.untilMatchId is None):
+            print("--rankBackfill needs --untilDate or --untilMatchId")
+            raise SystemExit(1)
+        untilDate = datetime.strptime(args.untilDate,"%Y-%m-%d").replace(tzinfo=timezone.utc) if args.untilDate else None
+        backfill = rankBackfill.RankBackfill(untilMatchId=args.untilMatchId,untilDate=untilDate,workers=args.bracketWorkers,checkpointDir=args.checkpointDir,logging=logging)
+        backfill.run()
+        raise SystemExit(0)
+    if(args.backfill and args.pipeline):
+        fetchWorkers,parseWorkers,writeWorkers = args.stageWorkers
+        report = seqCrawler.pipelineCrawl(args.backfill[0],args.backfill[1],fetchWorkers=fetchWorkers,parseWorkers=parseWorkers,writeWorkers=writeWorkers,checkpointDir=args.checkpointDir,logging=logging)
+        for stage in report['stages']:
+            print("{name:<6} workers={workers} items={items} {throughput}/s utilisation={utilisation} blocked={blocked}s max queue={maxDepth}".format(**stage))
+        print("{} inserted {} duplicates in {}s, bottleneck: {}".format(report['inserted'],report['duplicates'],report['elapsed'],report['bottleneck']))
+        if(report['failedWindows']):
+            print("{} failed/empty windows, retried by rerunning the same --backfill range: {}".format(len(report['failedWindows']),report['failedWindows']))
+        raise SystemExit(0)
+    if(args.backfill):
+        crawler = seqCrawler.SeqCrawler(args.backfill[0],args.backfill[1],shards=args.shards,checkpointDir=args.checkpointDir,logging=logging)
+        crawler.run()
+        raise SystemExit(0)
+    #one pooled client shared by every job, warmed up before the first run
+    manager = connectionManager.getManager(os.getenv("MONGO_CONNECTION_STR"),maxPoolSize=args.poolSize,minPoolSize=min(4,args.poolSize))
+    manager.warmUp()
+    #every source + job shares one loop, intervals follow the fraction of new matches per run
+    loop = adaptiveScheduler.AdaptiveScheduler(logging=logging)
+    api = apiHandler.ApiHandler() #pooled keep-alive sessions reused by every poll until shutdown
+    loop.add("healthCheck",manager.healthCheck,60,adaptive=False,delay=60)
+    loop.add("cadence",lambda: print("cadence: {}".format(loop.cadence())),args.reportInterval,adaptive=False,delay=args.reportInterval)
+    sources = [name.strip() for name in source.split(",")]
+    if('OpenDota' in sources):
+        loop.add("populate:OpenDota",populateJob,600,minInterval=args.minInterval,maxInterval=args.maxInterval,args=(logging,"OpenDota"),kwargs={"profileDir":args.profileDir,"api":api})
+        loop.add("merge",mergeMatches,1800,minInterval=args.minInterval,maxInterval=max(args.maxInterval,3600),args=(logging,workers,batchSize),kwargs={"profileDir":args.profileDir,"api":api},delay=60)
+    if('Steam' in sources):
+        cursor = checkpoint.CrawlCursor('steam',checkpoint=checkpoint.Checkpoint(os.path.join(args.checkpointDir,'steam_cursor.json')))
+        cursor.load(seed=getLatestSequenceNumber) #db is only queried if no cursor has been persisted
+        #full pages mean the crawl is behind the live sequence: runs back to back at minimum interval
+        loop.add("backfill:Steam",populateJob,5,minInterval=1,maxInterval=args.maxInterval,targetYield=0.9,args=(logging,"Steam",cursor),kwargs={"profileDir":args.profileDir,"api":api})
+    try:
+        loop.run()
+    finally:
+        api.close()
@@ -0,0 +1,73 @@
+import threading
+
+class RecentIdFilter(object):
+    def __init__(self,span=1<<25):
+        '''exact membership bitmap of recently seen integer ids (e.g. match ids)
+        covers a sliding window of the span ids below the highest id seen, older ids are forgotten
+        1 bit per id: default span of 2^25 ids uses 4MB and covers several days of match ids
+        no false positives (unlike a bloom filter) so a new match is never dropped
+        params---
+            span: int: window size in ids, rounded up to a multiple of 8
+        '''
+        self.span=((span+7)//8)*8
+        self.bits=bytearray(self.span//8)
+        self.high=None
+        self.__lock=threading.Lock()
+
+    def __clear(self,start,count):
+        '''clear count bit positions starting at start, wrapping around the ring'''
+        if(count>=self.span):
+            self.bits[:]=bytes(len(self.bits))
+            return
+        while count>0:
+            pos=start%self.span
+            run=min(count,self.span-pos)
+            end=pos+run
+            #leading bits up to a byte boundary, whole bytes, trailing bits
+            while pos<end and pos%8:
+                self.bits[pos>>3]&=~(1<<(pos&7))&0xFF
+                pos+=1
+            whole=(end-pos)//8
+            if(whole):
+                self.bits[pos>>3:(pos>>3)+whole]=bytes(whole)
+                pos+=whole*8
+            while pos<end:
+                self.bits[pos>>3]&=~(1<<(pos&7))&0xFF
+                pos+=1
+            start+=run
+            count-=run
+
+    def __contains__(self,value):
+        with self.__lock:
+            if(self.high is None or value>self.high or value<=self.high-self.span):
+                return False
+            pos=value%self.span
+            return bool(self.bits[pos>>3]&(1<<(pos&7)))
+
+    def add(self,value):
+        '''mark id as seen, sliding the window forward if it is the new highest id'''
+        with self.__lock:
+            if(self.high is None):
+                self.high=value
+            elif(value>self.high):
+                self.__clear(self.high+1,value-self.high) #reuse ring positions of ids falling out of the window
+                self.high=value
+            elif(value<=self.high-self.span): #older than the window
+                return
+            pos=value%self.span
+            self.bits[pos>>3]|=1<<(pos&7)
+
+    def update(self,values):
+        '''mark every id in values as seen'''
+        for value in sorted(values): #ascending so the window only ever slides forward once per batch
+            self.add(value)
+
+_filters={}
+_filtersLock=threading.Lock()
+
+def getFilter(namespace,span=1<<25):
+    '''process wide filter for a namespace e.g. 'dota2.matches' so it survives across job runs'''
+    with _filtersLock:
+        if(namespace not in _filters):
+            _filters[namespace]=RecentIdFilter(span)
+        return _filters[namespace]
@@ -0,0 +1,261 @@
+import os
+import time
+import threading
+import multiprocessing
+import apiHandler
+import dbHandler
+import parseData
+from checkpoint import Checkpoint
+from pipeline import Pipeline
+
+MAX_MATCHES_PER_REQUEST=100 #GetMatchHistoryBySequenceNum cap
+
+def splitShards(start,end,shards):
+    '''split match_seq_num range [start,end) into contiguous shards
+    params---
+    start: int: first sequence number (inclusive)
+    end: int: last sequence number (exclusive)
+    shards: int: number of shards
+    returns---
+    list of (shardStart, shardEnd) tuples
+    '''
+    if(end<=start):
+        return []
+    shards=max(1,min(shards,end-start))
+    size,extra=divmod(end-start,shards)
+    ranges=[]
+    shardStart=start
+    for i in range(shards):
+        shardEnd=shardStart+size+(1 if i<extra else 0)
+        ranges.append((shardStart,shardEnd))
+        shardStart=shardEnd
+    return ranges
+
+def crawlShard(start,end,checkpointDir='checkpoints',conStr=None,collectionName='matches_steam',maxFailures=5,logging=None):
+    '''crawl a single shard from its checkpoint to end, persisting progress after every inserted batch
+    params---
+    start: int: first sequence number of shard (inclusive)
+    end: int: last sequence number of shard (exclusive)
+    checkpointDir: str: directory holding shard checkpoints
+    conStr: str: mongodb connection string: default MONGO_CONNECTION_STR env var
+    collectionName: str: collection to insert matches into
+    maxFailures: int: consecutive failed requests before the shard gives up (rerun resumes it)
+    logging: enable logs
+    returns---
+    state: dict: final checkpoint of shard
+    '''
+    logger=None
+    if(logging):
+        import logging
+        logging.basicConfig(level=logging.NOTSET)
+        logger=logging.getLogger(__name__)
+    checkpoint=Checkpoint(os.path.join(checkpointDir,'shard_{}_{}.json'.format(start,end)))
+    state=checkpoint.load({'start':start,'end':end,'next':start,'inserted':0,'done':False})
+    if(state['done']):
+        return state
+    api=apiHandler.ApiHandler()
+    db=dbHandler.dbHandler(conStr or os.getenv('MONGO_CONNECTION_STR'))
+    db.connect(id='match_id',dbName='dota2',collectionName=collectionName)
+    parse=parseData.parseData()
+    failures=0
+    try:
+        while state['next']<end:
+            url=api.fetchMatchHistoryBySeqNum(**{"start_at_match_seq_num":state['next'],"matches_requested":min(MAX_MATCHES_PER_REQUEST,end-state['next'])})
+            try:
+                matches=parse.parseMatchesSteam(api.sendRequest(url))
+            except (KeyError,TypeError) as err: #failed request returns None / error payload
+                failures+=1
+                print('Shard {}-{} request failed ({}): {}'.format(start,end,failures,err))
+                if(failures>=maxFailures):
+                    break
+                time.sleep(2**failures)
+                continue
+            matches=[match for match in matches if match['match_seq_num']<end]
+            if(not matches): #reached live head of the sequence
+                break
+            inserted=db.ingestData(matches) #unordered so replaying a batch after a crash only counts duplicates
+            if(inserted is None or inserted['errors']): #write failed: retry the same position, never checkpoint past it
+                failures+=1
+                print('Shard {}-{} write failed ({}): {}'.format(start,end,failures,inserted))
+                if(failures>=maxFailures):
+                    break
+                time.sleep(2**failures)
+                continue
+            failures=0
+            state['next']=matches[-1]['match_seq_num']+1
+            state['inserted']+=inserted['new']
+            checkpoint.save(state)
+            if(logger):
+                logger.info('Shard {}-{} at {}'.format(start,end,state['next']))
+        state['done']=state['next']>=end
+        checkpoint.save(state)
+    finally:
+        api.close()
+        db.endSession()
+    return state
+
+class SeqCrawler(object):
+    def __init__(self,start,end,shards=4,checkpointDir='checkpoints',conStr=None,collectionName='matches_steam',logging=None):
+        '''crawl a match_seq_num range with one worker process per shard
+        each shard keeps its own checkpoint so after a crash rerunning with the same range resumes every shard independently
+        params---
+            start: int: first sequence number (inclusive)
+            end: int: last sequence number (exclusive)
+            shards: int: number of shards/worker processes
+            checkpointDir: str: directory holding shard checkpoints
+            conStr: str: mongodb connection string: default MONGO_CONNECTION_STR env var
+            collectionName: str: collection to insert matches into
+            logging: enable logs
+        '''
+        self.shards=splitShards(start,end,shards)
+        self.checkpointDir=checkpointDir
+        self.conStr=conStr
+        self.collectionName=collectionName
+        self.logging=logging
+
+    def run(self):
+        '''run every shard in parallel and wait for them to finish
+        returns---
+        list of final shard states
+        '''
+        if(not self.shards):
+            return []
+        args=[(start,end,self.checkpointDir,self.conStr,self.collectionName,5,self.logging) for start,end in self.shards]
+        with multiprocessing.Pool(processes=len(self.shards)) as pool:
+            states=pool.starmap(crawlShard,args)
+        for state in states:
+            print('Shard {}-{}: {} matches inserted, {}'.format(state['start'],state['end'],state['inserted'],'done' if state['done'] else 'incomplete at {}'.format(state['next'])))
+        return states
+
+class WindowProgress(object):
+    def __init__(self,start,end,checkpoint,step=MAX_MATCHES_PER_REQUEST):
+        '''resume state of a pipelineCrawl: windows finish out of order so the checkpoint keeps a low watermark
+        (every window below next is resolved) plus the resolved windows above it
+        windows that failed or came back empty are resolved into retry and run first by the next run
+        params---
+            start/end: int: sequence number range [start, end)
+            checkpoint: Checkpoint: persisted after every resolved window
+            step: int: window size
+        '''
+        self.step=step
+        self.checkpoint=checkpoint
+        self.state=checkpoint.load({'start':start,'end':end,'next':start,'resolved':[],'retry':[],'inserted':0,'duplicates':0,'done':False})
+        self.__resolved=set(self.state['resolved'])
+        self.__lock=threading.Lock()
+
+    def windows(self):
+        '''window starts still to crawl: last run's retries first, then every unresolved window from the watermark
+        returns---
+        generator of int
+        '''
+        end=self.state['end']
+        retry=sorted(set(self.state['retry']))
+        with self.__lock:
+            self.state['retry']=[] #resolved again by this run
+        yield from retry
+        for window in range(self.state['next'],end,self.step):
+            if(window not in self.__resolved):
+                yield window
+
+    def resolve(self,window,retry=False,inserted=0,duplicates=0):
+        '''record a finished window and persist
+        params---
+        window: int: window start
+        retry: bool: failed or empty: rerun by the next run
+        '''
+        with self.__lock:
+            if(retry):
+                self.state['retry'].append(window)
+            self.state['inserted']+=inserted
+            self.state['duplicates']+=duplicates
+            if(window>=self.state['next']):
+                self.__resolved.add(window)
+                while(self.state['next'] in self.__resolved):
+                    self.__resolved.discard(self.state['next'])
+                    self.state['next']+=self.step
+            self.state['resolved']=sorted(self.__resolved)
+            self.state['done']=self.state['next']>=self.state['end'] and not self.state['retry']
+            self.checkpoint.save(self.state)
+
+def pipelineCrawl(start,end,fetchWorkers=8,parseWorkers=2,writeWorkers=2,queueSize=16,conStr=None,collectionName='matches_steam',maxAttempts=3,checkpointDir='checkpoints',logging=None):
+    '''crawl a match_seq_num range in one process as overlapping fetch -> parse -> write stages (see pipeline.Pipeline)
+    the range is cut into windows of MAX_MATCHES_PER_REQUEST sequence numbers: a window holds at most that many matches
+    so one request per window covers it and windows can be fetched in any order
+    progress is checkpointed per window (see WindowProgress): rerunning the same range resumes it and retries failed/empty windows
+    params---
+    start: int: first sequence number (inclusive)
+    end: int: last sequence number (exclusive)
+    fetchWorkers/parseWorkers/writeWorkers: int: threads per stage
+    queueSize: int: max items waiting between two stages
+    conStr: str: mongodb connection string: default MONGO_CONNECTION_STR env var
+    collectionName: str: collection to insert matches into
+    maxAttempts: int: requests per window before it is reported as failed
+    checkpointDir: str: directory holding the range's checkpoint
+    logging: enable logs
+    returns---
+    dict: pipeline report plus 'inserted', 'duplicates' (this run), 'failedWindows' (every window start that failed or was empty:
+          retried by the next run of the range) and 'done'
+    '''
+    progress=WindowProgress(start,end,Checkpoint(os.path.join(checkpointDir,'pipeline_{}_{}.json'.format(start,end))))
+    if(progress.state['done']):
+        return {'elapsed':0,'fed':0,'stages':[],'bottleneck':None,'inserted':0,'duplicates':0,'failedWindows':[],'done':True}
+    api=apiHandler.ApiHandler(poolSize=fetchWorkers)
+    db=dbHandler.dbHandler(conStr or os.getenv('MONGO_CONNECTION_STR'),shared=True,seen=True)
+    db.connect(id='match_id',dbName='dota2',collectionName=collectionName)
+    parse=parseData.parseData()
+    totals={'inserted':0,'duplicates':0}
+    lock=threading.Lock() #writers update totals concurrently
+    def fetch(windowStart):
+        '''network only: raw body of the window's page'''
+        url=api.fetchMatchHistoryBySeqNum(**{"start_at_match_seq_num":windowStart,"matches_requested":MAX_MATCHES_PER_REQUEST})
+        for attempt in range(maxAttempts):
+            body=''.join(api.streamRequest(url)) #empty on a failed request
+            if(body):
+                return (windowStart,body)
+            time.sleep(2**attempt)
+        raise IOError('no response for window {}'.format(windowStart))
+    def parsePage(item):
+        '''cpu: decode the page and keep the window's matches'''
+        windowStart,body=item
+        windowEnd=min(windowStart+MAX_MATCHES_PER_REQUEST,end)
+        matches=[match for match in parse.iterMatchesSteam([body]) if match['match_seq_num']<windowEnd]
+        if(not matches): #past the live head (or a gap): not resolved as crawled
+            progress.resolve(windowStart,retry=True)
+            return None
+        return matches
+    def write(matches):
+        '''db: unordered duplicate tolerant insert'''
+        stats=db.ingestData(matches)
+        if(stats is None or stats['errors']): #window is retried instead of checkpointed past unwritten matches
+            raise IOError('insert failed for {} matches from {}: {}'.format(len(matches),matches[0]['match_seq_num'],stats))
+        with lock:
+            totals['inserted']+=stats['new']
+            totals['duplicates']+=stats['duplicates']+stats['filtered']
+        progress.resolve(windowOf(matches),inserted=stats['new'],duplicates=stats['duplicates']+stats['filtered'])
+        return stats
+    def windowOf(item): #stage items are window starts, (window start, body) pages or match lists
+        if(isinstance(item,int)):
+            return item
+        if(isinstance(item,tuple)):
+            return item[0]
+        return start+(item[0]['match_seq_num']-start)//MAX_MATCHES_PER_REQUEST*MAX_MATCHES_PER_REQUEST
+    def tracked(fn):
+        '''a window whose stage raises is resolved for retry before the pipeline records the failure'''
+        def run(item):
+            try:
+                return fn(item)
+            except Exception:
+                progress.resolve(windowOf(item),retry=True)
+                raise
+        return run
+    runner=Pipeline(queueSize=queueSize,logging=logging)
+    runner.addStage('fetch',tracked(fetch),fetchWorkers,windowOf).addStage('parse',tracked(parsePage),parseWorkers,windowOf).addStage('write',tracked(write),writeWorkers,windowOf)
+    try:
+        report=runner.run(progress.windows(),reportInterval=30)
+    finally:
+        api.close()
+        db.endSession()
+    report.update(totals)
+    report['failedWindows']=sorted(set(progress.state['retry']))
+    report['done']=progress.state['done']
+    return report
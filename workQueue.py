@@ -0,0 +1,154 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne, ASCENDING, errors
+from indexSpecs import ensureIndexes
+
+QUEUE_COLLECTION='match_queue'
+PENDING='pending'
+LEASED='leased'
+DONE='done'
+FAILED='failed'
+
+class WorkQueue(object):
+    def __init__(self,collection,leaseSeconds=600,maxAttempts=5,retryDelay=900,logging=None):
+        '''matches waiting for details kept in a small indexed collection instead of scanning matches for detailed: {$exists: false}
+        one document per match: {_id: match_id, seq: match_seq_num, state, attempts, token, leaseUntil, availableAt, enqueued, doneAt}
+        pending -> leased (claimed by a worker until leaseUntil) -> done, or back to pending if released or the lease expired
+        released matches are only claimed again after availableAt so a drain loop doesn't burn their attempts back to back
+        params---
+            collection: pymongo collection: the queue e.g. db[QUEUE_COLLECTION], declared indexes are created once per process
+            leaseSeconds: float: claimed matches return to pending if not completed within this
+            maxAttempts: int: claims of a match before it is marked failed instead of pending again
+            retryDelay: float: seconds a released match waits before it can be claimed again
+            logging: enable logs
+        '''
+        self.collection=collection
+        self.leaseSeconds=leaseSeconds
+        self.maxAttempts=maxAttempts
+        self.retryDelay=retryDelay
+        ensureIndexes(collection)
+        if(logging):
+            import logging
+            logging.basicConfig(level=logging.NOTSET)
+            self.logger=logging.getLogger(__name__)
+        else:
+            self.logger=None
+
+    def enqueue(self,docs,key='match_id',seqKey='match_seq_num'):
+        '''add matches as pending, matches already queued (in any state) are left untouched
+        params---
+        docs: list of dict: matches holding key + seqKey, docs without a seqKey can't be detailed and are skipped
+        returns---
+        int: matches newly queued
+        '''
+        now=datetime.now(timezone.utc)
+        ops=[UpdateOne({'_id':doc[key]},{'$setOnInsert':{'seq':doc[seqKey],'state':PENDING,'attempts':0,'enqueued':now}},upsert=True)
+             for doc in docs if doc.get(key) is not None and doc.get(seqKey) is not None]
+        if(not ops):
+            return 0
+        try:
+            return self.collection.bulk_write(ops,ordered=False).upserted_count
+        except errors.BulkWriteError as bwe: #concurrent enqueues of the same match race on _id
+            return len(bwe.details.get('upserted',[]))
+
+    def seed(self,source,batchSize=5000):
+        '''queue every undetailed match of source: one pass over the (detailed, match_seq_num) index for matches stored before the queue existed
+        params---
+        source: pymongo collection: matches
+        returns---
+        int: matches newly queued
+        '''
+        queued=0
+        batch=[]
+        for doc in source.find({'detailed':{'$exists':False}},{'match_id':1,'match_seq_num':1,'_id':0}).sort([('match_seq_num',ASCENDING)]):
+            batch.append(doc)
+            if(len(batch)>=batchSize):
+                queued+=self.enqueue(batch)
+                batch=[]
+        if(batch):
+            queued+=self.enqueue(batch)
+        print('{} matches queued for details'.format(queued))
+        return queued
+
+    def expireLeases(self):
+        '''return matches whose lease ran out (crashed/stuck worker) to pending, or failed after maxAttempts claims
+        returns---
+        int: leases expired
+        '''
+        now=datetime.now(timezone.utc)
+        expired={'state':LEASED,'leaseUntil':{'$lt':now}}
+        failed=self.collection.update_many(dict(expired,attempts={'$gte':self.maxAttempts}),{'$set':{'state':FAILED},'$unset':{'token':'','leaseUntil':''}})
+        released=self.collection.update_many(expired,{'$set':{'state':PENDING},'$unset':{'token':'','leaseUntil':''}})
+        count=failed.modified_count+released.modified_count
+        if(count and self.logger):
+            self.logger.info('{} expired leases returned to the queue ({} failed)'.format(count,failed.modified_count))
+        return count
+
+    def claim(self,batchSize=1000):
+        '''lease up to batchSize pending matches, lowest match_seq_num first so detail windows are dense
+        the update re-checks state per document so concurrent workers never lease the same match: a worker losing a race just gets fewer
+        returns---
+        (token, list of {'_id': match_id, 'seq': match_seq_num}): token identifies the lease for complete/release
+        '''
+        self.expireLeases()
+        token=uuid.uuid4().hex
+        now=datetime.now(timezone.utc)
+        available={'state':PENDING,'availableAt':{'$not':{'$gt':now}}} #no availableAt = never released
+        ids=[doc['_id'] for doc in self.collection.find(available,{'_id':1}).sort([('seq',ASCENDING)]).limit(batchSize)]
+        if(not ids):
+            return token,[]
+        self.collection.update_many(dict(available,_id={'$in':ids}),
+                                    {'$set':{'state':LEASED,'token':token,'leaseUntil':now+timedelta(seconds=self.leaseSeconds)},'$inc':{'attempts':1}})
+        claimed=list(self.collection.find({'token':token},{'_id':1,'seq':1}).sort([('seq',ASCENDING)]))
+        if(self.logger):
+            self.logger.info('Claimed {} of {} pending matches'.format(len(claimed),len(ids)))
+        return token,claimed
+
+    def complete(self,ids,token):
+        '''mark leased matches done (removed by the ttl index after a week)
+        returns---
+        int: matches completed: lower than len(ids) if the lease expired and another worker claimed them
+        '''
+        if(not ids):
+            return 0
+        return self.collection.update_many({'_id':{'$in':list(ids)},'token':token},
+                                           {'$set':{'state':DONE,'doneAt':datetime.now(timezone.utc)},'$unset':{'token':'','leaseUntil':''}}).modified_count
+
+    def release(self,ids,token,delay=None,countAttempt=True):
+        '''return leased matches to pending e.g. details not available yet, failed after maxAttempts claims
+        params---
+        ids: match ids leased with token
+        token: str: from claim
+        delay: float: seconds before they can be claimed again: default retryDelay
+        countAttempt: bool: False for failures that weren't the match's fault (e.g. a bulk write error): the claim doesn't count towards maxAttempts
+        returns---
+        int: matches released
+        '''
+        if(not ids):
+            return 0
+        query={'_id':{'$in':list(ids)},'token':token}
+        unlease={'token':'','leaseUntil':''}
+        failed=0
+        if(countAttempt):
+            failed=self.collection.update_many(dict(query,attempts={'$gte':self.maxAttempts}),{'$set':{'state':FAILED},'$unset':unlease}).modified_count
+        availableAt=datetime.now(timezone.utc)+timedelta(seconds=self.retryDelay if delay is None else delay)
+        update={'$set':{'state':PENDING,'availableAt':availableAt},'$unset':unlease}
+        if(not countAttempt):
+            update['$inc']={'attempts':-1}
+        released=self.collection.update_many(query,update).modified_count
+        return failed+released
+
+    def counts(self):
+        '''matches per state from the state index
+        returns---
+        dict: {'pending','leased','done','failed'}
+        '''
+        return {state:self.collection.count_documents({'state':state}) for state in (PENDING,LEASED,DONE,FAILED)}
+
+    def isEmpty(self):
+        '''nothing ever queued (or everything expired): cheap metadata count'''
+        return self.collection.estimated_document_count()==0
+
+def getQueue(db,**options):
+    '''WorkQueue on the queue collection of a pymongo database'''
+    return WorkQueue(db[QUEUE_COLLECTION],**options)